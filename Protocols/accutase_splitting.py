@@ -6,6 +6,16 @@
 import math
 from opentrons import protocol_api
 from opentrons import types
+from cellmet.scheduling import ExposureTimer, IncubationTimer, Step, addition_parts, exchange_parts, removal_parts, step_seconds
+from cellmet.liquid_classes import LiquidClasses
+from cellmet.liquids import LiquidLevels, ReagentPlan, aspirate
+from cellmet.motion import MotionProfile
+from cellmet.ordering import order_wells
+from cellmet.profiling import Profiler
+from cellmet.tips import SECONDS_PER_TIP_CHANGE, TipInventory
+from cellmet.transfers import trip_positions
+from cellmet.trituration import Trituration
+from cellmet.wells import PlateLocations, add_from_reservoir, exchange, plate_wells, remove_to_waste, volume_scale
 
 metadata = {
     "apiLevel": "2.10",
@@ -14,7 +24,80 @@ metadata = {
     "description": "Perform iPSCs accutase splitting protocol to 6-well culture plate",
 }
 
+# Prepare the output plate during the 7 minutes accutase incubation instead of after it
+# A well to empty or load to fill only starts when its estimate and a safety margin fit before the mark; the rest follows after it
+OVERLAP_OUTPUT_PREP = True
+
+# Run the whole input plate workflow on the plate on the temperature module in slot 10,
+# without pausing for the input plate to be moved from slot 5 onto the module and back
+UNATTENDED_INCUBATION = True
+
+# Time the accutase incubation per well from its own addition, pacing the additions to the rate the wells are collected,
+# so every well is exposed for the same time (only with UNATTENDED_INCUBATION)
+EQUALIZE_EXPOSURE = False
+
+# Extra volume aspirated on every multi-dispense trip and blown out into the trash,
+# for more even dispenses (0 disables it)
+DISPOSAL_VOLUME = 0
+
+# Visit the wells in the order that cuts gantry travel for each kind of phase, instead of A1, A2, A3, B1, B2, B3
+OPTIMIZE_WELL_ORDER = True
+
+# Track the reagent levels and aspirate just below the meniscus at a higher flow rate,
+# instead of from the bottom of the reservoir wells
+TRACK_LIQUID_LEVELS = True
+
+# Changes to the flow rates (uL/s) and aspiration delays (s) of the liquid classes in cellmet.liquid_classes,
+# per class and field, e.g. {"waste": {"dispense": 750}}
+LIQUID_CLASS_CHANGES = {}
+
+# Mixing cycles and volume (uL) between the bottom and the top of each well before collecting the cells
+MIX_CYCLES = 5
+MIX_VOLUME = 450
+# Heights of the mixing cycles, in turn: aspirate heights (mm) above the aspiration point of each well, and dispense
+# heights (mm) above the well bottom at the opposite wall, None to dispense from the top of the well
+MIX_ASPIRATE_HEIGHTS = [0]
+MIX_DISPENSE_HEIGHTS = [None]
+# Mixing flow rates (uL/s); None keeps the rates of the cells liquid class
+MIX_ASPIRATE_RATE = None
+MIX_DISPENSE_RATE = None
+
+# PBS buffer (uL) per well for each wash; the wash is removed with 50 uL to spare
+PBS_WASH_VOLUME = 500
+
+# Output plates seeded from the input plate in one run, one per deck slot (free slots: 6, 1, 2, 3, 9,
+# and 5 with UNATTENDED_INCUBATION), and the cell suspension (uL) seeded per well of each, for 6-well plates:
+# the volumes set the split ratio between the plates, e.g. [100, 50] seeds the second plate at half the density
+OUTPUT_PLATE_SLOTS = [6]
+SEEDING_VOLUMES = [100]
+
+# 15 mL tubes (A1, B1, C1, ... of the tube rack) the cells are collected in, the input wells shared evenly between them.
+# Every pellet is resuspended in the same volume, so every tube holds the same cell suspension
+CELL_TUBES = 1
+
+# Culture plate labware. The wells and the pipetting points follow from its definition,
+# and the volumes in this script, written for 6-well plates, scale with the well area
+CULTURE_PLATE = "corning_6_wellplate_16.8ml_flat"
+
+# Remove the spent media and the PBS washes with a second P1000 on the left mount, refilling each well right after it is
+# emptied, while the right P1000 keeps its reagent tip
+WASTE_PIPETTE = False
+WASTE_PIPETTE_NAME = "p1000_single_gen2"
+# Deck slot of the waste pipette tip rack, one of the slots the output plates leave free
+WASTE_PIPETTE_TIPRACK_SLOT = 3
+
+# Move straight inside a well and hop just clear of the plate between its wells instead of lifting for every move,
+# with speed caps (mm/s) per kind of move: "well", "plate" or "deck", e.g. {"well": 100}
+PLANNED_MOVES = True
+MOVE_SPEEDS = {}
+
+# Report the time and calls of the pipette and protocol calls per section at the end of the run
+PROFILE = False
+
 def run(protocol: protocol_api.ProtocolContext):
+    if PROFILE:
+        profiler = Profiler(protocol)
+
     # Load temperature module for media and input plate
     input_temp_mod = protocol.load_module(
         "temperature module gen2",
@@ -23,7 +106,7 @@ def run(protocol: protocol_api.ProtocolContext):
     )
 
     splitting_plate = input_temp_mod.load_labware(
-        "corning_6_wellplate_16.8ml_flat",
+        CULTURE_PLATE,
         label="Input Plate - Accutase Splitting",
     )
 
@@ -40,17 +123,28 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # Load labware, tiprack, and pipettes
     # Ecah accutase tubes need to be pre-filled with 5mL of PBS buffer
-    input_plate = protocol.load_labware(
-        load_name="corning_6_wellplate_16.8ml_flat",
-        location=5,
-        label="Input Culture Plate",
-    )
-
-    output_plate = protocol.load_labware(
-        load_name="corning_6_wellplate_16.8ml_flat",
-        location=6,
-        label="Output Culture Plate",
-    )
+    if UNATTENDED_INCUBATION:
+        # The input culture plate is placed on the temperature module before the run
+        input_plate = splitting_plate
+    else:
+        input_plate = protocol.load_labware(
+            load_name=CULTURE_PLATE,
+            location=5,
+            label="Input Culture Plate",
+        )
+
+    if len(SEEDING_VOLUMES) != len(OUTPUT_PLATE_SLOTS):
+        raise ValueError("SEEDING_VOLUMES needs one volume for each of the {} output plates".format(len(OUTPUT_PLATE_SLOTS)))
+    if WASTE_PIPETTE and WASTE_PIPETTE_TIPRACK_SLOT in OUTPUT_PLATE_SLOTS:
+        raise ValueError("Slot {} holds an output plate and the waste pipette tip rack".format(WASTE_PIPETTE_TIPRACK_SLOT))
+    output_plates = [
+        protocol.load_labware(
+            load_name=CULTURE_PLATE,
+            location=slot,
+            label="Output Culture Plate {}".format(i + 1) if len(OUTPUT_PLATE_SLOTS) > 1 else "Output Culture Plate",
+        )
+        for i, slot in enumerate(OUTPUT_PLATE_SLOTS)
+    ]
 
     accutase_tubes = protocol.load_labware(
         load_name="opentrons_15_tuberack_falcon_15ml_conical",
@@ -64,11 +158,14 @@ def run(protocol: protocol_api.ProtocolContext):
         label="Waste Reservoir",
     )
 
-    tiprack_1000 = protocol.load_labware(
+    # Tip racks: the rack in slot 4, and more racks on free slots when the run needs more tips
+    tip_inventory = TipInventory(
+        protocol,
         load_name="opentrons_96_filtertiprack_1000ul",
-        location=4,
+        slot=4,
         label="Filter Tip 1000",
     )
+    tiprack_1000 = tip_inventory.racks[0]
 
     p1000_s = protocol.load_instrument(
         instrument_name="p1000_single",
@@ -76,17 +173,44 @@ def run(protocol: protocol_api.ProtocolContext):
         tip_racks=[tiprack_1000],
     )
 
+    # Flow rates and delays for each liquid the P1000 moves
+    liquids = LiquidClasses(protocol, LIQUID_CLASS_CHANGES)
+
+    if WASTE_PIPETTE:
+        waste_inventory = TipInventory(
+            protocol,
+            load_name="opentrons_96_filtertiprack_1000ul",
+            slot=WASTE_PIPETTE_TIPRACK_SLOT,
+            label="Filter Tip 1000 Waste",
+        )
+
+        p1000_waste = protocol.load_instrument(
+            instrument_name=WASTE_PIPETTE_NAME,
+            mount="left",
+            tip_racks=[waste_inventory.racks[0]],
+        )
+        liquids.use(p1000_waste, "waste")
+
+    # Straight moves inside the wells and low hops between the wells of a plate
+    if PLANNED_MOVES:
+        motion = MotionProfile(speeds=MOVE_SPEEDS)
+        motion.apply(p1000_s)
+        if WASTE_PIPETTE:
+            motion.apply(p1000_waste)
+
     # Reagents
     input_pbs = reagent_reservior["A1"]
     output_pbs = reagent_reservior["A2"]
+    spare_pbs = reagent_reservior["A3"]
     media_1 = reagent_reservior["A4"]
     media_2 = reagent_reservior["A5"]
     media_3 = reagent_reservior["A6"]
     media_4 = reagent_reservior["A7"]
     media_5 = reagent_reservior["A8"]
+    spare_media = [reagent_reservior["A9"], reagent_reservior["A10"], reagent_reservior["A11"]]
     accutase = reagent_reservior["A12"]
     waste = waste_reservoir["A1"]
-    cell_accutase = accutase_tubes["A1"]
+    cell_tubes = accutase_tubes.wells()[:CELL_TUBES]
 
     # Default settings
     # Aspirate at the default flowrate of 150 ul/s
@@ -104,167 +228,241 @@ def run(protocol: protocol_api.ProtocolContext):
     reagent_temp_mod.set_temperature(37)
     input_temp_mod.set_temperature(37)
 
-    # Create a well list for 6-well culture plate well locations to output the correct well location for liquid transfer
-    culture_12 = 4 # number of columns for 12-well culture plate, 3x4
-
-    culture_6 = 3 # number of columns for 6-well culture plate, 2x3
-    count = 2
-    well_list = []
-    for j in range(count):
-        for i in range(1,(culture_6+1)):
-            well_list.append(f"{chr(j + 65)}{i}")
-
-    # Constants for Protocol
-    well_num = 6
-    diameter = input_plate['A1'].diameter
-    depth = input_plate['A1'].depth
-    z_pos_low = -9.2 # z-coordinate for the well bottom of culture plate
-    z_pos_high = depth-7 # z-coordinate for the well top of culture plate
-    x_pos = 0 # x-coordinate for the well of culture plate
-    x_pos_left = -(diameter/2-2.5) # x-coordinate for the well left top of culture plate
-    x_pos_right = diameter/2-2.5 # y-coordinate for the well right top of culture plate
-    y_pos = 0 # y-coordinate for the well of culture plate
-    y_pos_low = -(diameter/2-2.5) # y-coordinate for the well bottom of culture plate
-    y_pos_high = diameter/2-2.5 # y-coordinate for the well top of culture plate
-
-    # Remove Waste Media for Input Plate
-    protocol.comment("Remove waste media for input culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Remove Waste Media 2000uL/well
-        for j in range(0, 2):
-            # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(1000)
-            p1000_s.dispense(1000, waste.top())
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Perform PBS Wash for Input Plate
-    protocol.comment("Perform PBS wash for input culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(500, input_pbs.bottom())
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Wells of the culture plates row by row, and the factor from the 6-well plate volumes below to their wells
+    well_list = plate_wells(input_plate)
+    well_num = len(well_list)
+    scale = volume_scale(input_plate)
+    if well_num % CELL_TUBES:
+        raise ValueError("The {} input wells do not share evenly between {} cell tubes".format(well_num, CELL_TUBES))
+
+    # Aspirate (bottom) and dispense (top) locations of every well, worked out once per plate
+    input_locations = PlateLocations(input_plate, well_list)
+    output_locations = [PlateLocations(output_plate, well_list) for output_plate in output_plates]
+
+    # Mixing of the input plate wells before the cells are collected, timed per well
+    mixing = Trituration(
+        protocol,
+        p1000_s,
+        volume=scale*MIX_VOLUME,
+        cycles=MIX_CYCLES,
+        aspirate_heights=MIX_ASPIRATE_HEIGHTS,
+        dispense_heights=MIX_DISPENSE_HEIGHTS,
+        aspirate_rate=MIX_ASPIRATE_RATE,
+        dispense_rate=MIX_DISPENSE_RATE,
+    )
 
-    # Remove PBS Wash for Input Plate
-    protocol.comment("Remove PBS wash for input culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(550)
-        p1000_s.dispense(550, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Visit order of the wells for each kind of phase
+    # Removals return to the waste reservoir after every well, additions return to their source after every load,
+    # following the loads their volume per well (uL) is dispensed in
+    # The accutase mixture is collected in the order the accutase was added, so every well incubates for the same time
+    def removal_order(plate):
+        if not OPTIMIZE_WELL_ORDER:
+            return well_list
+        return order_wells(plate, well_list, start=tiprack_1000, anchor=waste, end=waste)
+
+    def addition_order(plate, volume, source=reagent_reservior, disposal_volume=DISPOSAL_VOLUME):
+        if not OPTIMIZE_WELL_ORDER:
+            return well_list
+        trips = trip_positions(p1000_s, volume, well_num, disposal_volume)
+        return order_wells(plate, well_list, start=source, anchor=source, trips=trips, end=p1000_s.trash_container)
+
+    input_removal_order = removal_order(input_plate)
+    input_wash_order = addition_order(input_plate, scale*PBS_WASH_VOLUME)
+    input_addition_order = addition_order(input_plate, scale*500)
+    output_removal_orders = [removal_order(output_plate) for output_plate in output_plates]
+    output_wash_orders = [addition_order(output_plate, scale*PBS_WASH_VOLUME) for output_plate in output_plates]
+    output_media_orders = [addition_order(output_plate, scale*1500) for output_plate in output_plates]
+
+    # Cell tube each input well is collected in, in collection order, and the tube each output plate is seeded from,
+    # spreading the seeding volumes evenly over the tubes, largest first
+    collection_tubes = [cell_tubes[i*CELL_TUBES//well_num] for i in range(well_num)]
+    tube_draws = [0]*CELL_TUBES
+    seeding_tubes = [None]*len(output_plates)
+    for plate in sorted(range(len(output_plates)), key=lambda plate: -SEEDING_VOLUMES[plate]):
+        tube = tube_draws.index(min(tube_draws))
+        tube_draws[tube] += well_num*scale*SEEDING_VOLUMES[plate]
+        seeding_tubes[plate] = cell_tubes[tube]
+    seeding_orders = [addition_order(output_plate, scale*seeding_volume, tube, disposal_volume=0)
+                      for output_plate, tube, seeding_volume in zip(output_plates, seeding_tubes, SEEDING_VOLUMES)]
+    # mTeSR media (uL) every pellet is resuspended in: 1 mL, or 10% more than the most any tube seeds, added 1 mL at a time
+    resuspension = max(1000, math.ceil(max(tube_draws)*1.1/100)*100)
+    resuspension_loads = math.ceil(resuspension/1000)
+
+    # Reagent volumes (uL) to fill the reservoir with: the volumes the protocol draws plus the 10% overage
+    # The PBS for the output plates and the media for the output plates and the cell pellets continue in the spare wells
+    # when one is not enough
+    reagents = ReagentPlan()
+    reagents.add("PBS Buffer (input plate)", [input_pbs], [well_num*scale*PBS_WASH_VOLUME])
+    output_pbs_sources = reagents.add("PBS Buffer (output plate)", [output_pbs, spare_pbs],
+                                      [well_num*scale*PBS_WASH_VOLUME]*len(output_plates))
+    pellet_loads = [resuspension/resuspension_loads]*(resuspension_loads*CELL_TUBES)
+    media_sources = reagents.add("mTeSR Media", [media_1, media_2, media_3, media_4, media_5] + spare_media,
+                                 [well_num*scale*1500]*len(output_plates) + pellet_loads)
+    output_media_sources, pellet_media_sources = media_sources[:len(output_plates)], media_sources[len(output_plates):]
+    reagents.add("Accutase", [accutase], [well_num*scale*500])
+    protocol.comment(reagents.fill_sheet())
+
+    # Tips the run needs, one per step: the removals and additions of the input plate (the removals paired with the
+    # additions on the waste pipette), the same for the output plates, each step covering every output plate with one tip,
+    # and the collection into every cell tube, the resuspension of every pellet and the seeding of every output plate,
+    # one tip each. None of them grows with the plates or tubes, only the volumes do
+    # A spare tip on each pipette covers an output plate step finished after the incubation it did not fit in
+    input_plate_tips = 2 if WASTE_PIPETTE else 4
+    output_plate_tips = 2 if WASTE_PIPETTE else 4
+    cell_tube_tips = 3
+    spare_tips = 1 if OVERLAP_OUTPUT_PREP else 0
+    tip_inventory.stock(p1000_s, input_plate_tips + output_plate_tips + cell_tube_tips, near=input_plate, spare=spare_tips)
+    protocol.comment(tip_inventory.report())
+    if WASTE_PIPETTE:
+        # One tip for the two removals of the input plate, and one for each output plate step
+        waste_inventory.stock(p1000_waste, 1 + output_plate_tips, near=input_plate, spare=spare_tips)
+        protocol.comment(waste_inventory.report())
+
+    # Starting reagent volumes for liquid level tracking
+    if TRACK_LIQUID_LEVELS:
+        levels = LiquidLevels()
+        reagents.fill(levels)
+    else:
+        levels = None
+
+    if WASTE_PIPETTE:
+        # Remove Waste Media and Perform PBS Wash for Input Plate, well by well
+        protocol.comment("Exchange waste media for PBS wash for input culture plate!")
+        liquids.use(p1000_s, "pbs")
+        p1000_waste.pick_up_tip()
+        p1000_s.pick_up_tip()
+        # Remove Waste Media 2000uL/well and dispense PBS Buffer 500uL/well right after, several wells per aspiration
+        exchange(p1000_waste, scale*1000, waste, p1000_s, scale*PBS_WASH_VOLUME, input_pbs.bottom(), input_locations,
+                 input_wash_order, repeats=2, disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        p1000_s.drop_tip()
+    else:
+        # Remove Waste Media for Input Plate
+        protocol.comment("Remove waste media for input culture plate!")
+        liquids.use(p1000_s, "waste")
+        p1000_s.pick_up_tip()
+        # Remove Waste Media 2000uL/well from the bottom of each well
+        remove_to_waste(p1000_s, input_locations, input_removal_order, scale*1000, waste, repeats=2)
+        p1000_s.drop_tip()
+
+        # Perform PBS Wash for Input Plate
+        protocol.comment("Perform PBS wash for input culture plate!")
+        liquids.use(p1000_s, "pbs")
+        p1000_s.pick_up_tip()
+        # Dispense PBS Buffer 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+        add_from_reservoir(p1000_s, scale*PBS_WASH_VOLUME, input_pbs.bottom(), input_locations, input_wash_order,
+                           disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        p1000_s.drop_tip()
+
+        # Remove PBS Wash for Input Plate
+        protocol.comment("Remove PBS wash for input culture plate!")
+        liquids.use(p1000_s, "waste")
+        p1000_s.pick_up_tip()
+        # Remove PBS Buffer 500uL/well from the bottom of each well
+        remove_to_waste(p1000_s, input_locations, input_removal_order, scale*(PBS_WASH_VOLUME + 50), waste)
+        p1000_s.drop_tip()
 
     # Perform Accutase Splitting for Input Plate
     protocol.comment("Perform accutase splitting for input culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
+    liquids.use(p1000_s, "accutase")
     p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate Accutase 500uL/well
-        p1000_s.aspirate(500, accutase.bottom())
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense Accutase 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
+    if EQUALIZE_EXPOSURE and UNATTENDED_INCUBATION:
+        # The wells are collected one mixing and transfer apart, so they receive the accutase as far apart
+        collection_seconds = mixing.estimate(liquids["cells"]) + step_seconds(1, 1, tips=0)
+        exposure = ExposureTimer(protocol, minutes=7, interval=collection_seconds)
+    else:
+        exposure = None
+    # Dispense Accutase 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+    if WASTE_PIPETTE:
+        # Each well is emptied of the PBS Buffer 500uL/well right before its accutase
+        exchange(p1000_waste, scale*(PBS_WASH_VOLUME + 50), waste, p1000_s, scale*500, accutase.bottom(), input_locations,
+                 input_addition_order, disposal_volume=DISPOSAL_VOLUME, levels=levels,
+                 before_dispense=exposure.add if exposure else None)
+        p1000_waste.drop_tip()
+    else:
+        add_from_reservoir(p1000_s, scale*500, accutase.bottom(), input_locations, input_addition_order,
+                           disposal_volume=DISPOSAL_VOLUME, levels=levels, before_dispense=exposure.add if exposure else None)
     p1000_s.drop_tip()
 
+    # Output plate preparation, run inside the accutase incubation window when OVERLAP_OUTPUT_PREP is set
+    # Every step covers all the output plates, one plate after the other with the same tip, in parts of a well to empty or a
+    # load of wells to fill; a step that reaches the end of the incubation stops between two parts and is finished after it
+    # With the waste pipette, a step picks up a tip on both pipettes
+    def begin_step(text, liquid):
+        def begin():
+            protocol.comment(text)
+            liquids.use(p1000_s, liquid)
+            if WASTE_PIPETTE:
+                p1000_waste.pick_up_tip()
+            p1000_s.pick_up_tip()
+        return begin
+
+    def end_step():
+        if WASTE_PIPETTE:
+            p1000_waste.drop_tip()
+        p1000_s.drop_tip()
+
+    # Remove Waste Media 2000uL/well from the bottom of each well, and the PBS Buffer 500uL/well after the wash
+    waste_parts, wash_removal_parts = [], []
+    for locations, order in zip(output_locations, output_removal_orders):
+        waste_parts += removal_parts(p1000_s, locations, order, scale*1000, waste, repeats=2)
+        wash_removal_parts += removal_parts(p1000_s, locations, order, scale*(PBS_WASH_VOLUME + 50), waste)
+    # Dispense PBS Buffer 500uL/well and fresh media 1500uL/well at the top y-coordinate and top z-coordinate of each well,
+    # several wells per aspiration
+    wash_parts, media_parts = [], []
+    for locations, wash_order, pbs, media_order, media in zip(output_locations, output_wash_orders, output_pbs_sources,
+                                                                output_media_orders, output_media_sources):
+        wash_parts += addition_parts(p1000_s, scale*PBS_WASH_VOLUME, pbs.bottom(), locations, wash_order, DISPOSAL_VOLUME, levels)
+        media_parts += addition_parts(p1000_s, scale*1500, media.bottom(), locations, media_order, DISPOSAL_VOLUME, levels)
+    output_prep = [
+        Step("remove waste media", waste_parts, begin_step("Remove waste media for output culture plates!", "waste"), end_step),
+        Step("PBS wash", wash_parts, begin_step("Perform PBS wash for output culture plates!", "pbs"), end_step),
+        Step("remove PBS wash", wash_removal_parts, begin_step("Remove PBS wash for output culture plates!", "waste"), end_step),
+        Step("add fresh media", media_parts, begin_step("Add fresh media for output culture plates!", "media"), end_step),
+    ]
+    if WASTE_PIPETTE:
+        # The waste pipette empties every well right before its PBS Buffer or fresh media, in the loads of the addition
+        exchange_waste_parts, exchange_media_parts = [], []
+        for locations, wash_order, pbs, media_order, media in zip(output_locations, output_wash_orders, output_pbs_sources,
+                                                                    output_media_orders, output_media_sources):
+            exchange_waste_parts += exchange_parts(p1000_waste, scale*1000, waste, p1000_s, scale*PBS_WASH_VOLUME, pbs.bottom(),
+                                                   locations, wash_order, 2, DISPOSAL_VOLUME, levels)
+            exchange_media_parts += exchange_parts(p1000_waste, scale*(PBS_WASH_VOLUME + 50), waste, p1000_s, scale*1500,
+                                                   media.bottom(), locations, media_order, 1, DISPOSAL_VOLUME, levels)
+        output_prep = [
+            Step("exchange waste media for PBS wash", exchange_waste_parts,
+                 begin_step("Exchange waste media for PBS wash for output culture plates!", "pbs"), end_step,
+                 overhead=2*SECONDS_PER_TIP_CHANGE),
+            Step("exchange PBS wash for fresh media", exchange_media_parts,
+                 begin_step("Exchange PBS wash for fresh media for output culture plates!", "media"), end_step,
+                 overhead=2*SECONDS_PER_TIP_CHANGE),
+        ]
+
     # Incubate Input Plate @37C for 7 Minutes
-    protocol.pause('Place input culture plate on the Temperature Module for 7 minutes incubation @37C for accutase splitting!')
-    protocol.delay(minutes=7)
-    protocol.pause('Complet incubate, place input culture plate to its original location!')
+    if not UNATTENDED_INCUBATION:
+        protocol.pause('Place input culture plate on the Temperature Module for 7 minutes incubation @37C for accutase splitting!')
+    # Timed from the first accutase addition when the exposure is equalized, from now otherwise
+    incubation = exposure or IncubationTimer(protocol, minutes=7)
+    if OVERLAP_OUTPUT_PREP:
+        # Prepare the output plate while the accutase works, then wait out the rest of the 7 minutes
+        output_prep = incubation.run_within(output_prep)
+    # With the exposure equalized, every well waits for its own mark right before it is collected instead
+    if not exposure:
+        incubation.wait()
+    if not UNATTENDED_INCUBATION:
+        protocol.pause('Complet incubate, place input culture plate to its original location!')
 
     # Collect Cell/Accutase Mixture for Centrifuge
     protocol.comment("Collect cell/accutase mixture for centrifuge!")
-    p1000_s.flow_rate.dispense = 300 # Change dispense speed to 300ul/s
+    liquids.use(p1000_s, "cells")
     p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
+    for well, tube in zip(input_addition_order, collection_tubes):
+        if exposure:
+            exposure.wait_for(well)
         # Collect Cell/Accutase Mixture 500uL/well
-        # Mix 3 times, p1000_s.mix(3, 450)
-        for i in range(0, 5):
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(450)
-            p1000_s.move_to(adjusted_location_top)
-            p1000_s.dispense(450)
-        p1000_s.aspirate(520)
-        p1000_s.dispense(520, cell_accutase.bottom(15))
+        # Mix between the bottom and the top of the well
+        mixing(input_locations, well)
+        p1000_s.aspirate(scale*520, input_locations.bottom(well))
+        p1000_s.dispense(scale*520, tube.bottom(15))
         p1000_s.blow_out()
     p1000_s.drop_tip()
     protocol.pause('Spin cell/accutase mixture @1000rpm for 4 minutes @4C/RT!')
@@ -286,150 +484,47 @@ def run(protocol: protocol_api.ProtocolContext):
     p1000_s.drop_tip()
     '''
 
-    # Add 1mL mTeSR medium with Y27632
-    protocol.comment("Add 1mL mTeSR medium with Y27632 to cell pellet!")
-    p1000_s.flow_rate.dispense = 250 # Change dispense speed to 250ul/s
+    # Add 1mL mTeSR medium with Y27632, or more when the output plates need more cell suspension
+    protocol.comment("Add {:g}mL mTeSR medium with Y27632 to cell pellet!".format(resuspension/1000))
+    liquids.use(p1000_s, "media")
     p1000_s.pick_up_tip()
-    p1000_s.aspirate(1000, media_1.bottom())
-    p1000_s.dispense(1000, cell_accutase.bottom(15))
+    # Add the media to every tube before mixing any, so the tip never returns to the media with cells on it
+    for i, source in enumerate(pellet_media_sources):
+        aspirate(p1000_s, resuspension/resuspension_loads, source.bottom(), levels)
+        p1000_s.dispense(resuspension/resuspension_loads, cell_tubes[i//resuspension_loads].bottom(15))
     # Mix 5 times, p1000_s.mix(5, 900)
-    for i in range (0, 5):
-        p1000_s.aspirate(900, cell_accutase.bottom(5))
-        p1000_s.dispense(1000, cell_accutase.bottom(15))
-    p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Remove Waste Media for Output Plate
-    protocol.comment("Remove waste media for output culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Remove Waste Media 2000uL/well
-        for j in range(0, 2):
-            # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(1000)
-            p1000_s.dispense(1000, waste.top())
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Perform PBS Wash for Output Plate
-    protocol.comment("Perform PBS wash for output culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(500, output_pbs.bottom())
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
+    liquids.use(p1000_s, "cells")
+    for tube in cell_tubes:
+        for i in range (0, 5):
+            p1000_s.aspirate(900, tube.bottom(5))
+            p1000_s.dispense(1000, tube.bottom(15))
         p1000_s.blow_out()
     p1000_s.drop_tip()
 
-    # Remove PBS Wash for Output Plate
-    protocol.comment("Remove PBS wash for output culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(550)
-        p1000_s.dispense(550, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Prepare the output plate for any steps that did not fit into the incubation
+    for step in output_prep:
+        step()
 
-    # Add Fresh Media for Output Plate
-    protocol.comment("Add fresh media for output culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
+    # Add 100uL Cell Suspension Into Fresh Well of Output Plates
+    protocol.comment("Add cell suspension into gresh well of output culture plates!")
+    liquids.use(p1000_s, "seeding")
     p1000_s.pick_up_tip()
-    for j in range(0,2):
-        for i in range(0, well_num):
-        # Aspirate fresh media 2000uL/well
-            p1000_s.aspirate(750, media_1.bottom())
-            # Get the center of each well.
-            center_location = output_plate[well_list[i]].center()
-            # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-            adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-            # Move to top y-coordinate and top z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_top)
-            # Dispense fresh media 2000uL/well
-            p1000_s.dispense(750)
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Add 100uL Cell Suspension Into Fresh Well of Output Plate
-    protocol.comment("Add 100uL cell suspension into gresh well of output culture plate!")
-    p1000_s.flow_rate.dispense = 125 # Change default dispense speed to 125ul/s
-    p1000_s.pick_up_tip()
-    p1000_s.aspirate(600, cell_accutase.bottom(2))
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Add 100uL cell suspension per well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(100)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
+    # Add the seeding volume per well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+    for locations, order, tube, seeding_volume in zip(output_locations, seeding_orders, seeding_tubes, SEEDING_VOLUMES):
+        add_from_reservoir(p1000_s, scale*seeding_volume, tube.bottom(2), locations, order)
     p1000_s.drop_tip()
 
     # Protocol Completed!
+    tip_inventory.check()
+    if WASTE_PIPETTE:
+        waste_inventory.check()
+    protocol.comment(mixing.report())
+    if exposure:
+        protocol.comment(exposure.report())
+    if PLANNED_MOVES:
+        protocol.comment(motion.report())
+    if PROFILE:
+        protocol.comment(profiler.report())
     protocol.comment("Protocol completed! Put plate back into 37C incubator and perform medium change daily until cells are ready for passage ")
     # Turn off robot rail lights
     protocol.set_rail_lights(False)
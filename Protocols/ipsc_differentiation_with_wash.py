@@ -6,6 +6,14 @@
 import math
 from opentrons import protocol_api
 from opentrons import types
+from cellmet.liquid_classes import LiquidClasses
+from cellmet.liquids import LiquidLevels, ReagentPlan
+from cellmet.motion import MotionProfile
+from cellmet.ordering import order_wells
+from cellmet.profiling import Profiler
+from cellmet.tips import TipInventory, TipPolicy
+from cellmet.transfers import trip_positions
+from cellmet.wells import PlateLocations, add_from_reservoir, column_wells, exchange, plate_wells, remove_to_waste, volume_scale
 
 metadata = {
     "apiLevel": "2.10",
@@ -14,7 +22,65 @@ metadata = {
     "description": "Perform iPSC differentiation protocol with PBS washing to 6-well culture plate",
 }
 
+# Extra volume aspirated on every multi-dispense trip and blown out into the trash,
+# for more even dispenses (0 disables it)
+DISPOSAL_VOLUME = 0
+
+# Visit the wells in the order that cuts gantry travel for each kind of phase, instead of A1, A2, A3, B1, B2, B3
+OPTIMIZE_WELL_ORDER = True
+
+# Track the reagent levels and aspirate just below the meniscus at a higher flow rate,
+# instead of from the bottom of the reservoir wells
+TRACK_LIQUID_LEVELS = True
+
+# Changes to the flow rates (uL/s) and aspiration delays (s) of the liquid classes in cellmet.liquid_classes,
+# per class and field, e.g. {"waste": {"dispense": 750}}
+LIQUID_CLASS_CHANGES = {}
+
+# PBS buffer (uL) per well for each wash; the wash is removed with 250 uL to spare
+PBS_WASH_VOLUME = 500
+
+# Number of culture plates fed in one run, each phase runs across all plates before the next one starts
+PLATE_COUNT = 1
+
+# Deck slots the culture plates are placed in, in order
+CULTURE_PLATE_SLOTS = [8, 9, 5, 6, 4, 1, 2, 3]
+
+# Share one tip between plates for reagent additions, which dispense from above the wells,
+# instead of a fresh tip for every plate
+REUSE_TIPS = True
+
+# Culture plate labware. The wells and the pipetting points follow from its definition,
+# and the volumes in this script, written for 6-well plates, scale with the well area
+CULTURE_PLATE = "corning_6_wellplate_16.8ml_flat"
+
+# Run the removals, washes and feeds of plates with a 9 mm well pitch (96-well plates) a column of eight wells
+# per motion with an 8-channel pipette on the left mount; wells outside full columns stay with the single-channel pipette
+MULTI_CHANNEL = False
+MULTI_CHANNEL_PIPETTE = "p300_multi_gen2"
+MULTI_CHANNEL_TIPRACK = "opentrons_96_filtertiprack_200ul"
+# Deck slot of the 8-channel tip rack, taken from the culture plate slots
+MULTI_CHANNEL_TIPRACK_SLOT = 3
+
+# Remove spent media and washes with a second P1000 on the left mount, refilling each well right after it is emptied,
+# while the right P1000 keeps its reagent tip. Takes the left mount, so it cannot be combined with MULTI_CHANNEL
+WASTE_PIPETTE = False
+WASTE_PIPETTE_NAME = "p1000_single_gen2"
+# Deck slot of the waste pipette tip rack, taken from the culture plate slots
+WASTE_PIPETTE_TIPRACK_SLOT = 3
+
+# Move straight inside a well and hop just clear of the plate between its wells instead of lifting for every move,
+# with speed caps (mm/s) per kind of move: "well", "plate" or "deck", e.g. {"well": 100}
+PLANNED_MOVES = True
+MOVE_SPEEDS = {}
+
+# Report the time and calls of the pipette and protocol calls per section at the end of the run
+PROFILE = False
+
 def run(protocol: protocol_api.ProtocolContext):
+    if PROFILE:
+        profiler = Profiler(protocol)
+
     # Load temperature module for buffer and media
     reagent_temp_mod = protocol.load_module(
         "tempdeck",
@@ -42,17 +108,29 @@ def run(protocol: protocol_api.ProtocolContext):
         label="Waste Reservoir",
     )
 
-    culture_plate = protocol.load_labware(
-        load_name="corning_6_wellplate_16.8ml_flat",
-        location=8,
-        label="Culture Plate",
-    )
+    if MULTI_CHANNEL and WASTE_PIPETTE:
+        raise ValueError("MULTI_CHANNEL and WASTE_PIPETTE both need the left mount")
+    tiprack_slots = [MULTI_CHANNEL_TIPRACK_SLOT] if MULTI_CHANNEL else [WASTE_PIPETTE_TIPRACK_SLOT] if WASTE_PIPETTE else []
+    plate_slots = [slot for slot in CULTURE_PLATE_SLOTS if slot not in tiprack_slots]
+    if PLATE_COUNT > len(plate_slots):
+        raise ValueError("At most {} culture plates fit on the deck".format(len(plate_slots)))
+    culture_plates = [
+        protocol.load_labware(
+            load_name=CULTURE_PLATE,
+            location=slot,
+            label="Culture Plate {}".format(n + 1),
+        )
+        for n, slot in enumerate(plate_slots[:PLATE_COUNT])
+    ]
 
-    tiprack_1000 = protocol.load_labware(
+    # Tip racks: the rack in slot 11, and more racks on free slots when the run needs more tips
+    tip_inventory = TipInventory(
+        protocol,
         load_name="opentrons_96_filtertiprack_1000ul",
-        location=11,
+        slot=11,
         label="Filter Tip 1000",
     )
+    tiprack_1000 = tip_inventory.racks[0]
 
     p1000_s = protocol.load_instrument(
         instrument_name="p1000_single",
@@ -60,18 +138,60 @@ def run(protocol: protocol_api.ProtocolContext):
         tip_racks=[tiprack_1000],
     )
 
+    # Flow rates and delays for each liquid the P1000 moves
+    liquids = LiquidClasses(protocol, LIQUID_CLASS_CHANGES)
+
+    if MULTI_CHANNEL:
+        multi_inventory = TipInventory(
+            protocol,
+            load_name=MULTI_CHANNEL_TIPRACK,
+            slot=MULTI_CHANNEL_TIPRACK_SLOT,
+            label="Filter Tip 8-Channel",
+        )
+        tiprack_multi = multi_inventory.racks[0]
+
+        p300_m = protocol.load_instrument(
+            instrument_name=MULTI_CHANNEL_PIPETTE,
+            mount="left",
+            tip_racks=[tiprack_multi],
+        )
+
+    if WASTE_PIPETTE:
+        waste_inventory = TipInventory(
+            protocol,
+            load_name="opentrons_96_filtertiprack_1000ul",
+            slot=WASTE_PIPETTE_TIPRACK_SLOT,
+            label="Filter Tip 1000 Waste",
+        )
+
+        p1000_waste = protocol.load_instrument(
+            instrument_name=WASTE_PIPETTE_NAME,
+            mount="left",
+            tip_racks=[waste_inventory.racks[0]],
+        )
+
+    # Straight moves inside the wells and low hops between the wells of a plate
+    if PLANNED_MOVES:
+        motion = MotionProfile(speeds=MOVE_SPEEDS)
+        motion.apply(p1000_s)
+        if MULTI_CHANNEL:
+            motion.apply(p300_m)
+        if WASTE_PIPETTE:
+            motion.apply(p1000_waste)
+
     # Reagents in well format
-    pbs_buffer_1 = reagent_reservior [0]
-    media_1 = reagent_reservior[11]
+    # PBS buffer fills the reservoir from A1, media from A12 backwards, as many wells as the plates need
+    pbs_buffers = [reagent_reservior["A{}".format(i)] for i in range(1, 5)]
+    media_wells = [reagent_reservior["A{}".format(i)] for i in range(12, 4, -1)]
     waste = waste_reservoir["A1"]
 
-'''
+    '''
     # Reagents in tube format
     # For tube, tube.bottom(22)
     pbs_buffer = reagent_tubes["A1"]
     media = reagent_tubes["B1"]
     waste = waste_reservoir["A1"]
-'''
+    '''
 
     # Default settings
     # Aspirate at the default flowrate of 150 ul/s
@@ -88,122 +208,169 @@ def run(protocol: protocol_api.ProtocolContext):
     # Set temperature module to 37C
     reagent_temp_mod.set_temperature(37)
 
-    # Create a well list for 6-well culture plate well locations to output the correct well location for liquid transfer
-    culture_12 = 4 # number of columns for 12-well culture plate, 3x4
-
-    culture_6 = 3 # number of columns for 6-well culture plate, 2x3
-    count = 2
-    well_list = []
-    for j in range(count):
-        for i in range(1,(culture_6+1)):
-            well_list.append(f"{chr(j + 65)}{i}")
-
-    # Constants for Protocol
-    well_num = 6
-    diameter = culture_plate['A1'].diameter
-    depth = culture_plate['A1'].depth
-    z_pos_low = -9.2 # z-coordinate for the well bottom of culture plate
-    z_pos_high = depth-7 # z-coordinate for the well top of culture plate
-    x_pos = 0 # x-coordinate for the well of culture plate
-    x_pos_left = -(diameter/2-2.5) # x-coordinate for the well left top of culture plate
-    x_pos_right = diameter/2-2.5 # y-coordinate for the well right top of culture plate
-    y_pos = 0 # y-coordinate for the well of culture plate
-    y_pos_low = -(diameter/2-2.5) # y-coordinate for the well bottom of culture plate
-    y_pos_high = diameter/2-2.5 # y-coordinate for the well top of culture plate
-
-    # Remove Waste Media
-    protocol.comment("Remove waste media!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = culture_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Remove Waste Media 2000uL/well
-        for j in range(0, 2):
-            # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(1000)
-            p1000_s.dispense(1000, waste.top())
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Perform PBS Wash
-    protocol.comment("Perform PBS wash!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(500, pbs_buffer_1.bottom())
-        # Get the center of each well.
-        center_location = culture_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Remove PBS Wash
-    protocol.comment("Remove PBS wash!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = culture_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(750)
-        p1000_s.dispense(750, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Add Fresh Media
-    protocol.comment("Add fresh media!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for j in range(0,2):
-        for i in range(0, well_num):
-        # Aspirate fresh media 2000uL/well
-            p1000_s.aspirate(925, media_1.bottom())
-            # Get the center of each well.
-            center_location = culture_plate[well_list[i]].center()
-            # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-            adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-            # Move to top y-coordinate and top z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_top)
-            # Dispense fresh media 2000uL/well
-            p1000_s.dispense(1000)
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Wells of the culture plates row by row, and the factor from the 6-well plate volumes below to their wells
+    well_list = plate_wells(culture_plates[0])
+    well_num = len(well_list)
+    scale = volume_scale(culture_plates[0])
+
+    # Aspirate (bottom) and dispense (top) locations of every well, worked out once per plate
+    culture_locations = [PlateLocations(plate, well_list) for plate in culture_plates]
+
+    # Wells each pipette serves: the 8-channel pipette the full columns, by their top well, the single-channel one the rest
+    if MULTI_CHANNEL:
+        column_list, single_list = column_wells(culture_plates[0], well_list, p300_m.channels)
+    else:
+        column_list, single_list = [], well_list
+
+    # Visit order of the wells of each plate for each kind of phase
+    # Removals return to the waste reservoir after every well, additions return to the reagent reservoir after every load,
+    # following the loads the PBS wash and the fresh media are dispensed in
+    def visit_orders(pipette, tiprack, wells):
+        if not OPTIMIZE_WELL_ORDER or not wells:
+            return [wells]*len(culture_plates), [wells]*len(culture_plates), [wells]*len(culture_plates)
+        wash_trips = trip_positions(pipette, scale*PBS_WASH_VOLUME, len(wells), DISPOSAL_VOLUME)
+        media_trips = trip_positions(pipette, scale*2*925, len(wells), DISPOSAL_VOLUME)
+        removal_orders = [order_wells(plate, wells, start=tiprack, anchor=waste, end=waste) for plate in culture_plates]
+        wash_orders = [order_wells(plate, wells, start=reagent_reservior, anchor=reagent_reservior, trips=wash_trips,
+                                   end=pipette.trash_container)
+                       for plate in culture_plates]
+        media_orders = [order_wells(plate, wells, start=reagent_reservior, anchor=reagent_reservior, trips=media_trips,
+                                    end=pipette.trash_container)
+                        for plate in culture_plates]
+        return removal_orders, wash_orders, media_orders
+
+    # Reservoir well each plate draws from, and the volumes (uL) to fill them with: what the plates draw plus the 10% overage
+    reagents = ReagentPlan()
+    pbs_sources = reagents.add("PBS Buffer", pbs_buffers, [well_num*scale*PBS_WASH_VOLUME]*len(culture_plates))
+    media_sources = reagents.add("Fresh Media", media_wells, [well_num*scale*2*925]*len(culture_plates))
+    protocol.comment(reagents.fill_sheet())
+
+    # Starting reagent volumes for liquid level tracking
+    if TRACK_LIQUID_LEVELS:
+        levels = LiquidLevels()
+        reagents.fill(levels)
+    else:
+        levels = None
+
+    # Tips each pipette needs: one per plate for every removal (on the waste pipette when there is one), and one for every
+    # addition (one per plate without tip reuse), counting every channel; the racks go on the slots the plates leave free
+    removals = 0 if WASTE_PIPETTE else len(culture_plates)
+    additions = 1 if REUSE_TIPS else len(culture_plates)
+    tip_inventory.stock(p1000_s, 2*(removals + additions) if single_list else 0, near=culture_plates[0])
+    protocol.comment(tip_inventory.report())
+    if MULTI_CHANNEL:
+        multi_inventory.stock(p300_m, 2*(removals + additions)*p300_m.channels if column_list else 0, near=culture_plates[0])
+        protocol.comment(multi_inventory.report())
+    if WASTE_PIPETTE:
+        waste_inventory.stock(p1000_waste, 2*len(culture_plates), near=culture_plates[0])
+        protocol.comment(waste_inventory.report())
+
+    # Removals touch the wells, so every plate gets its own tip; additions only touch the reagent
+    # The 8-channel pipette keeps its default flow rates, the liquid classes are set for the P1000
+    tips = TipPolicy(p1000_s, reuse=REUSE_TIPS)
+    pipettes = [(p1000_s, tips) + visit_orders(p1000_s, tiprack_1000, single_list)]
+    if MULTI_CHANNEL:
+        multi_tips = TipPolicy(p300_m, reuse=REUSE_TIPS)
+        pipettes.append((p300_m, multi_tips) + visit_orders(p300_m, tiprack_multi, column_list))
+    for _, policy, *_ in pipettes:
+        policy.share(*pbs_buffers)
+        policy.share(*media_wells)
+    if WASTE_PIPETTE:
+        waste_tips = TipPolicy(p1000_waste, reuse=REUSE_TIPS)
+        liquids.use(p1000_waste, "waste")
+
+    # Remove waste media, wash and feed one well at a time with the waste pipette, or phase by phase across the plates
+    if WASTE_PIPETTE:
+        _, _, _, wash_orders, media_orders = pipettes[0]
+
+        # Remove Waste Media and Perform PBS Wash, well by well
+        protocol.comment("Remove waste media and perform PBS wash!")
+        liquids.use(p1000_s, "pbs")
+        for plate, locations, order, source in zip(culture_plates, culture_locations, wash_orders, pbs_sources):
+            waste_tips.pick_up(plate)
+            tips.pick_up(source)
+            # Remove Waste Media 2000uL/well and dispense PBS Buffer 500uL/well right after, several wells per aspiration
+            exchange(p1000_waste, scale*1000, waste, p1000_s, scale*PBS_WASH_VOLUME, source.bottom(), locations, order,
+                     repeats=2, disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        waste_tips.drop()
+        tips.drop()
+
+        # Remove PBS Wash and Add Fresh Media, well by well
+        protocol.comment("Remove PBS wash and add fresh media!")
+        liquids.use(p1000_s, "media")
+        for plate, locations, order, source in zip(culture_plates, culture_locations, media_orders, media_sources):
+            waste_tips.pick_up(plate)
+            tips.pick_up(source)
+            # Remove PBS Buffer 500uL/well and dispense fresh media 2x925uL/well right after, several wells per aspiration
+            exchange(p1000_waste, scale*(PBS_WASH_VOLUME + 250), waste, p1000_s, scale*2*925, source.bottom(),
+                     locations, order, disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        waste_tips.drop()
+        tips.drop()
+    else:
+        # Remove Waste Media
+        protocol.comment("Remove waste media!")
+        liquids.use(p1000_s, "waste")
+        for pipette, policy, removal_orders, *_ in pipettes:
+            for plate, locations, order in zip(culture_plates, culture_locations, removal_orders):
+                if not order:
+                    continue
+                policy.pick_up(plate)
+                # Remove Waste Media 2000uL/well from the bottom of each well
+                remove_to_waste(pipette, locations, order, scale*1000, waste, repeats=2)
+            policy.drop()
+
+        # Perform PBS Wash
+        protocol.comment("Perform PBS wash!")
+        liquids.use(p1000_s, "pbs")
+        for pipette, policy, _, wash_orders, _ in pipettes:
+            for locations, order, source in zip(culture_locations, wash_orders, pbs_sources):
+                if not order:
+                    continue
+                policy.pick_up(source)
+                # Dispense PBS Buffer 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+                add_from_reservoir(pipette, scale*PBS_WASH_VOLUME, source.bottom(), locations, order,
+                                   disposal_volume=DISPOSAL_VOLUME, levels=levels)
+            policy.drop()
+
+        # Remove PBS Wash
+        protocol.comment("Remove PBS wash!")
+        liquids.use(p1000_s, "waste")
+        for pipette, policy, removal_orders, *_ in pipettes:
+            for plate, locations, order in zip(culture_plates, culture_locations, removal_orders):
+                if not order:
+                    continue
+                policy.pick_up(plate)
+                # Remove PBS Buffer 500uL/well from the bottom of each well
+                remove_to_waste(pipette, locations, order, scale*(PBS_WASH_VOLUME + 250), waste)
+            policy.drop()
+
+        # Add Fresh Media
+        protocol.comment("Add fresh media!")
+        liquids.use(p1000_s, "media")
+        for pipette, policy, _, _, media_orders in pipettes:
+            for locations, order, source in zip(culture_locations, media_orders, media_sources):
+                if not order:
+                    continue
+                policy.pick_up(source)
+                # Dispense fresh media 2x925uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+                add_from_reservoir(pipette, scale*2*925, source.bottom(), locations, order, disposal_volume=DISPOSAL_VOLUME, levels=levels)
+            policy.drop()
 
     # Protocol Completed!
+    tip_inventory.check()
+    if MULTI_CHANNEL:
+        multi_inventory.check()
+    if WASTE_PIPETTE:
+        waste_inventory.check()
+    protocol.comment(tips.report())
+    if MULTI_CHANNEL:
+        protocol.comment(multi_tips.report())
+    if WASTE_PIPETTE:
+        protocol.comment(waste_tips.report())
+    if PLANNED_MOVES:
+        protocol.comment(motion.report())
+    if PROFILE:
+        protocol.comment(profiler.report())
     protocol.comment("Protocol completed!")
     # Turn off robot rail lights
     protocol.set_rail_lights(False)
@@ -6,6 +6,16 @@
 import math
 from opentrons import protocol_api
 from opentrons import types
+from cellmet.scheduling import ExposureTimer, IncubationTimer, Step, addition_parts, exchange_parts, removal_parts, step_seconds
+from cellmet.liquid_classes import LiquidClasses
+from cellmet.liquids import LiquidLevels, ReagentPlan, aspirate
+from cellmet.motion import MotionProfile
+from cellmet.ordering import order_wells
+from cellmet.profiling import Profiler
+from cellmet.transfers import trip_positions
+from cellmet.tips import SECONDS_PER_TIP_CHANGE, TipInventory, TipPolicy
+from cellmet.trituration import Trituration
+from cellmet.wells import PlateLocations, add_from_reservoir, exchange, plate_wells, remove_to_waste, volume_scale
 
 metadata = {
     "apiLevel": "2.10",
@@ -14,7 +24,75 @@ metadata = {
     "description": "Perform iPSC-cardiomyocytes replating protocol to 6-well culture plate",
 }
 
+# Prepare the output plate during the 8 minutes trypsin dissociation instead of after the centrifuge pause
+# A well to empty or load to fill only starts when its estimate and a safety margin fit before the mark; the rest follows after it
+OVERLAP_OUTPUT_PREP = True
+
+# Run the whole input plate workflow on the plate on the temperature module in slot 10,
+# without pausing for the input plate to be moved from slot 5 onto the module and back
+UNATTENDED_INCUBATION = True
+
+# Time the trypsin incubation per well from its own addition, pacing the additions to the rate the wells are neutralized,
+# so every well is exposed for the same time (only with UNATTENDED_INCUBATION)
+EQUALIZE_EXPOSURE = False
+
+# Extra volume aspirated on every multi-dispense trip and blown out into the trash,
+# for more even dispenses (0 disables it)
+DISPOSAL_VOLUME = 0
+
+# Visit the wells in the order that cuts gantry travel for each kind of phase, instead of A1, A2, A3, B1, B2, B3
+OPTIMIZE_WELL_ORDER = True
+
+# Track the reagent levels and aspirate just below the meniscus at a higher flow rate,
+# instead of from the bottom of the reservoir wells
+TRACK_LIQUID_LEVELS = True
+
+# Changes to the flow rates (uL/s) and aspiration delays (s) of the liquid classes in cellmet.liquid_classes,
+# per class and field, e.g. {"waste": {"dispense": 750}}
+LIQUID_CLASS_CHANGES = {}
+
+# Mixing cycles and volume (uL) between the bottom and the top of each well before collecting the cells
+MIX_CYCLES = 5
+MIX_VOLUME = 700
+# Heights of the mixing cycles, in turn: aspirate heights (mm) above the aspiration point of each well, and dispense
+# heights (mm) above the well bottom at the opposite wall, None to dispense from the top of the well
+MIX_ASPIRATE_HEIGHTS = [0]
+MIX_DISPENSE_HEIGHTS = [None]
+# Mixing flow rates (uL/s); None keeps the rates of the cells liquid class
+MIX_ASPIRATE_RATE = None
+MIX_DISPENSE_RATE = None
+
+# PBS buffer (uL) per well for each wash; the wash is removed with 50 uL to spare
+PBS_WASH_VOLUME = 500
+
+# Keep the tip between wells of a step when no other liquid can be contaminated by it,
+# instead of a fresh tip for every collection well and media addition
+REUSE_TIPS = True
+
+# Culture plate labware. The wells and the pipetting points follow from its definition,
+# and the volumes in this script, written for 6-well plates, scale with the well area
+CULTURE_PLATE = "corning_6_wellplate_16.8ml_flat"
+
+# Remove the spent media, the fibronection coating and the PBS washes with a second P1000 on the left mount, refilling
+# each well right after it is emptied, while the right P1000 keeps its reagent tip; the coated wells keep their PBS wash
+# until each is seeded
+WASTE_PIPETTE = False
+WASTE_PIPETTE_NAME = "p1000_single_gen2"
+# Deck slot of the waste pipette tip rack: 1, 2, 3, 9, or 5 with UNATTENDED_INCUBATION
+WASTE_PIPETTE_TIPRACK_SLOT = 3
+
+# Move straight inside a well and hop just clear of the plate between its wells instead of lifting for every move,
+# with speed caps (mm/s) per kind of move: "well", "plate" or "deck", e.g. {"well": 100}
+PLANNED_MOVES = True
+MOVE_SPEEDS = {}
+
+# Report the time and calls of the pipette and protocol calls per section at the end of the run
+PROFILE = False
+
 def run(protocol: protocol_api.ProtocolContext):
+    if PROFILE:
+        profiler = Profiler(protocol)
+
     # Load temperature module for media and input plate
     input_temp_mod = protocol.load_module(
         "temperature module gen2",
@@ -23,7 +101,7 @@ def run(protocol: protocol_api.ProtocolContext):
     )
 
     dissociation_plate = input_temp_mod.load_labware(
-        "corning_6_wellplate_16.8ml_flat",
+        CULTURE_PLATE,
         label="Input Plate - 0.25% Trypsin-EDTA Dissociation",
     )
 
@@ -40,14 +118,18 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # Load labware, tiprack, and pipettes
     # Ecah accutase tubes need to be pre-filled with 5mL of PBS buffer
-    input_plate = protocol.load_labware(
-        load_name="corning_6_wellplate_16.8ml_flat",
-        location=5,
-        label="Input Culture Plate",
-    )
+    if UNATTENDED_INCUBATION:
+        # The input culture plate is placed on the temperature module before the run
+        input_plate = dissociation_plate
+    else:
+        input_plate = protocol.load_labware(
+            load_name=CULTURE_PLATE,
+            location=5,
+            label="Input Culture Plate",
+        )
 
     output_plate = protocol.load_labware(
-        load_name="corning_6_wellplate_16.8ml_flat",
+        load_name=CULTURE_PLATE,
         location=6,
         label="Output Culture Plate",
     )
@@ -64,11 +146,14 @@ def run(protocol: protocol_api.ProtocolContext):
         label="Waste Reservoir",
     )
 
-    tiprack_1000 = protocol.load_labware(
+    # Tip racks: the rack in slot 4, and more racks on free slots when the run needs more tips
+    tip_inventory = TipInventory(
+        protocol,
         load_name="opentrons_96_filtertiprack_1000ul",
-        location=4,
+        slot=4,
         label="Filter Tip 1000",
     )
+    tiprack_1000 = tip_inventory.racks[0]
 
     p1000_s = protocol.load_instrument(
         instrument_name="p1000_single",
@@ -76,6 +161,31 @@ def run(protocol: protocol_api.ProtocolContext):
         tip_racks=[tiprack_1000],
     )
 
+    # Flow rates and delays for each liquid the P1000 moves
+    liquids = LiquidClasses(protocol, LIQUID_CLASS_CHANGES)
+
+    if WASTE_PIPETTE:
+        waste_inventory = TipInventory(
+            protocol,
+            load_name="opentrons_96_filtertiprack_1000ul",
+            slot=WASTE_PIPETTE_TIPRACK_SLOT,
+            label="Filter Tip 1000 Waste",
+        )
+
+        p1000_waste = protocol.load_instrument(
+            instrument_name=WASTE_PIPETTE_NAME,
+            mount="left",
+            tip_racks=[waste_inventory.racks[0]],
+        )
+        liquids.use(p1000_waste, "waste")
+
+    # Straight moves inside the wells and low hops between the wells of a plate
+    if PLANNED_MOVES:
+        motion = MotionProfile(speeds=MOVE_SPEEDS)
+        motion.apply(p1000_s)
+        if WASTE_PIPETTE:
+            motion.apply(p1000_waste)
+
     # Reagents
     input_pbs = reagent_reservior["A1"]
     output_pbs = reagent_reservior["A2"]
@@ -103,218 +213,251 @@ def run(protocol: protocol_api.ProtocolContext):
     reagent_temp_mod.set_temperature(37)
     input_temp_mod.set_temperature(37)
 
-    # Create a well list for 6-well culture plate well locations to output the correct well location for liquid transfer
-    culture_12 = 4 # number of columns for 12-well culture plate, 3x4
-
-    culture_6 = 3 # number of columns for 6-well culture plate, 2x3
-    count = 2
-    well_list = []
-    for j in range(count):
-        for i in range(1,(culture_6+1)):
-            well_list.append(f"{chr(j + 65)}{i}")
-
-    # Constants for Protocol
-    well_num = 6
-    diameter = input_plate['A1'].diameter
-    depth = input_plate['A1'].depth
-    z_pos_low = -9.2 # z-coordinate for the well bottom of culture plate
-    z_pos_high = depth-7 # z-coordinate for the well top of culture plate
-    x_pos = 0 # x-coordinate for the well of culture plate
-    x_pos_left = -(diameter/2-2.5) # x-coordinate for the well left top of culture plate
-    x_pos_right = diameter/2-2.5 # y-coordinate for the well right top of culture plate
-    y_pos = 0 # y-coordinate for the well of culture plate
-    y_pos_low = -(diameter/2-2.5) # y-coordinate for the well bottom of culture plate
-    y_pos_high = diameter/2-2.5 # y-coordinate for the well top of culture plate
-
-    # Remove Waste Media for Input Plate
-    protocol.comment("Remove waste media for input culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Remove Waste Media 2000uL/well
-        for j in range(0, 2):
-            # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(1000)
-            p1000_s.dispense(1000, waste.top())
-            p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Wells of the culture plates row by row, and the factor from the 6-well plate volumes below to their wells
+    well_list = plate_wells(input_plate)
+    well_num = len(well_list)
+    scale = volume_scale(input_plate)
+
+    # Resuspension media (2mL per 6-well plate well) in loads of up to 1000uL
+    resuspension_loads = math.ceil(well_num*scale*2000/1000)
+    resuspension_load = well_num*scale*2000/resuspension_loads
+
+    # Aspirate (bottom) and dispense (top) locations of every well, worked out once per plate
+    input_locations = PlateLocations(input_plate, well_list)
+    output_locations = PlateLocations(output_plate, well_list)
+
+    # Mixing of the input plate wells before the cells are collected, timed per well
+    mixing = Trituration(
+        protocol,
+        p1000_s,
+        volume=scale*MIX_VOLUME,
+        cycles=MIX_CYCLES,
+        aspirate_heights=MIX_ASPIRATE_HEIGHTS,
+        dispense_heights=MIX_DISPENSE_HEIGHTS,
+        aspirate_rate=MIX_ASPIRATE_RATE,
+        dispense_rate=MIX_DISPENSE_RATE,
+    )
 
-    # Perform PBS Wash for Input Plate
-    protocol.comment("Perform PBS wash for input culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(500, input_pbs.bottom())
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Visit order of the wells for each kind of phase
+    # Removals return to the waste reservoir after every well, additions return to the reagent reservoir after every load,
+    # following the loads their volume per well is dispensed in
+    # FBS neutralization and collection follow the order the trypsin was added, so every well is dissociated for the same time
+    if OPTIMIZE_WELL_ORDER:
+        wash_trips = trip_positions(p1000_s, scale*PBS_WASH_VOLUME, well_num, DISPOSAL_VOLUME)
+        trypsin_trips = trip_positions(p1000_s, scale*500, well_num, DISPOSAL_VOLUME)
+        input_removal_order = order_wells(input_plate, well_list, start=tiprack_1000, anchor=waste, end=waste)
+        output_removal_order = order_wells(output_plate, well_list, start=tiprack_1000, anchor=waste, end=waste)
+        input_wash_order = order_wells(input_plate, well_list, start=reagent_reservior, anchor=reagent_reservior,
+                                       trips=wash_trips, end=p1000_s.trash_container)
+        input_addition_order = order_wells(input_plate, well_list, start=reagent_reservior, anchor=reagent_reservior,
+                                           trips=trypsin_trips, end=p1000_s.trash_container)
+        output_wash_order = order_wells(output_plate, well_list, start=reagent_reservior, anchor=reagent_reservior,
+                                        trips=wash_trips, end=p1000_s.trash_container)
+        mixing_order = order_wells(dissociation_plate, well_list, start=tiprack_1000, end=p1000_s.trash_container)
+        seeding_order = order_wells(output_plate, well_list, start=cell_1, anchor=cell_1, end=p1000_s.trash_container)
+    else:
+        input_removal_order = output_removal_order = input_wash_order = input_addition_order = output_wash_order = well_list
+        mixing_order = seeding_order = well_list
+
+    # Tip reuse: every input well is pooled into the cell tube. Each resuspension load mixes the cells in the tube,
+    # so the tip never goes back into the shared media reservoir wells
+    media_wells = [media_1, media_2, media_3]
+    tips = TipPolicy(p1000_s, reuse=REUSE_TIPS)
+    tips.share(cell_1, *[input_plate[well] for well in well_list])
+
+    # Reagent volumes (uL) to fill the reservoir with: the volumes the protocol draws plus the 10% overage
+    # The resuspension loads continue in the spare media wells when one is not enough
+    reagents = ReagentPlan()
+    reagents.add("PBS Buffer (input plate)", [input_pbs], [well_num*scale*PBS_WASH_VOLUME])
+    reagents.add("PBS Buffer (output plate)", [output_pbs], [well_num*scale*PBS_WASH_VOLUME])
+    resuspension_sources = reagents.add("RPMI B-27 Media", media_wells, [resuspension_load]*resuspension_loads)
+    reagents.add("0.25% Trypsin-EDTA", [dissociation], [well_num*scale*500])
+    reagents.add("FBS", [fbs], [well_num*scale*250])
+    protocol.comment(reagents.fill_sheet())
+
+    # Tips the run needs: one for each step, one per well for the FBS neutralization and one per resuspension load;
+    # without tip reuse also one per well for the collection; and a spare one for each trypsin window an output plate step
+    # can be stopped in and finished after
+    # The waste pipette takes one tip for the input plate, the output plate step and the seeding, four steps fewer
+    if REUSE_TIPS:
+        tips_needed = 10 + well_num + resuspension_loads
+    else:
+        tips_needed = 9 + 2*well_num + resuspension_loads
+    if WASTE_PIPETTE:
+        tips_needed -= 4
+    tip_inventory.stock(p1000_s, tips_needed, near=input_plate, spare=2 if OVERLAP_OUTPUT_PREP else 0)
+    protocol.comment(tip_inventory.report())
+    if WASTE_PIPETTE:
+        waste_inventory.stock(p1000_waste, 3, near=input_plate, spare=2 if OVERLAP_OUTPUT_PREP else 0)
+        protocol.comment(waste_inventory.report())
+
+    # Starting reagent volumes for liquid level tracking
+    if TRACK_LIQUID_LEVELS:
+        levels = LiquidLevels()
+        reagents.fill(levels)
+    else:
+        levels = None
+
+    if WASTE_PIPETTE:
+        # Remove Waste Media and Perform PBS Wash for Input Plate, well by well
+        protocol.comment("Exchange waste media for PBS wash for input culture plate!")
+        liquids.use(p1000_s, "pbs")
+        p1000_waste.pick_up_tip()
+        p1000_s.pick_up_tip()
+        # Remove Waste Media 2000uL/well and dispense PBS Buffer 500uL/well right after, several wells per aspiration
+        exchange(p1000_waste, scale*1000, waste, p1000_s, scale*PBS_WASH_VOLUME, input_pbs.bottom(), input_locations,
+                 input_wash_order, repeats=2, disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        p1000_s.drop_tip()
+    else:
+        # Remove Waste Media for Input Plate
+        protocol.comment("Remove waste media for input culture plate!")
+        liquids.use(p1000_s, "waste")
+        p1000_s.pick_up_tip()
+        # Remove Waste Media 2000uL/well from the bottom of each well
+        remove_to_waste(p1000_s, input_locations, input_removal_order, scale*1000, waste, repeats=2)
+        p1000_s.drop_tip()
 
-    # Remove PBS Wash for Input Plate
-    protocol.comment("Remove PBS wash for input culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(550)
-        p1000_s.dispense(550, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+        # Perform PBS Wash for Input Plate
+        protocol.comment("Perform PBS wash for input culture plate!")
+        liquids.use(p1000_s, "pbs")
+        p1000_s.pick_up_tip()
+        # Dispense PBS Buffer 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+        add_from_reservoir(p1000_s, scale*PBS_WASH_VOLUME, input_pbs.bottom(), input_locations, input_wash_order,
+                           disposal_volume=DISPOSAL_VOLUME, levels=levels)
+        p1000_s.drop_tip()
+
+        # Remove PBS Wash for Input Plate
+        protocol.comment("Remove PBS wash for input culture plate!")
+        liquids.use(p1000_s, "waste")
+        p1000_s.pick_up_tip()
+        # Remove PBS Buffer 500uL/well from the bottom of each well
+        remove_to_waste(p1000_s, input_locations, input_removal_order, scale*(PBS_WASH_VOLUME + 50), waste)
+        p1000_s.drop_tip()
 
     # Perform 0.25% Trypsin-EDTA Dissociation for Input Plate
     protocol.comment("Perform 0.25% Trypsin-EDTA dissociation for input culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
+    liquids.use(p1000_s, "trypsin")
     p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate 0.25% Trypsin-EDTA 500uL/well
-        p1000_s.aspirate(500, dissociation.bottom())
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense 0.25% Trypsin-EDTA 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
+    if EQUALIZE_EXPOSURE and UNATTENDED_INCUBATION:
+        # The wells are neutralized one tip change, FBS trip and mixing apart, so they receive the trypsin as far apart
+        neutralization_seconds = step_seconds(1, 1) + mixing.estimate(liquids["cells"])
+        exposure = ExposureTimer(protocol, minutes=8, interval=neutralization_seconds)
+    else:
+        exposure = None
+    # Dispense 0.25% Trypsin-EDTA 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+    if WASTE_PIPETTE:
+        # Each well is emptied of the PBS Buffer 500uL/well right before its trypsin
+        exchange(p1000_waste, scale*(PBS_WASH_VOLUME + 50), waste, p1000_s, scale*500, dissociation.bottom(), input_locations,
+                 input_addition_order, disposal_volume=DISPOSAL_VOLUME, levels=levels,
+                 before_dispense=exposure.add if exposure else None)
+        p1000_waste.drop_tip()
+    else:
+        add_from_reservoir(p1000_s, scale*500, dissociation.bottom(), input_locations, input_addition_order,
+                           disposal_volume=DISPOSAL_VOLUME, levels=levels, before_dispense=exposure.add if exposure else None)
     p1000_s.drop_tip()
 
+    # Output plate preparation, run inside the trypsin dissociation windows when OVERLAP_OUTPUT_PREP is set
+    # Every step runs in parts of a well to empty or a load of wells to fill; a step that reaches the end of a window stops
+    # between two parts and is finished in the next window, or after the incubation
+    # With the waste pipette, a step picks up a tip on both pipettes
+    def begin_step(text, liquid):
+        def begin():
+            protocol.comment(text)
+            liquids.use(p1000_s, liquid)
+            if WASTE_PIPETTE:
+                p1000_waste.pick_up_tip()
+            p1000_s.pick_up_tip()
+        return begin
+
+    def end_step():
+        if WASTE_PIPETTE:
+            p1000_waste.drop_tip()
+        p1000_s.drop_tip()
+
+    # Remove Fibronection Coating 1000uL/well from the bottom of each well, and the PBS Buffer 500uL/well after the wash
+    coating_parts = removal_parts(p1000_s, output_locations, output_removal_order, scale*1000, waste)
+    wash_removal_parts = removal_parts(p1000_s, output_locations, output_removal_order, scale*(PBS_WASH_VOLUME + 50), waste)
+    # Dispense PBS Buffer 500uL/well at the top y-coordinate and top z-coordinate of each well, several wells per aspiration
+    wash_parts = addition_parts(p1000_s, scale*PBS_WASH_VOLUME, output_pbs.bottom(), output_locations, output_wash_order,
+                                DISPOSAL_VOLUME, levels)
+    output_prep = [
+        Step("remove fibronection coating", coating_parts,
+             begin_step("Remove fibronection coating for output culture plate!", "waste"), end_step),
+        Step("PBS wash", wash_parts, begin_step("Perform PBS wash for output culture plate!", "pbs"), end_step),
+        Step("remove PBS wash", wash_removal_parts, begin_step("Remove PBS wash for output culture plate!", "waste"), end_step),
+    ]
+    if WASTE_PIPETTE:
+        # The waste pipette empties every well of its coating right before its PBS Buffer, in the loads of the wash;
+        # the PBS wash is removed at the seeding
+        output_prep = [
+            Step("exchange fibronection coating for PBS wash",
+                 exchange_parts(p1000_waste, scale*1000, waste, p1000_s, scale*PBS_WASH_VOLUME, output_pbs.bottom(),
+                                output_locations, output_wash_order, 1, DISPOSAL_VOLUME, levels),
+                 begin_step("Exchange fibronection coating for PBS wash for output culture plate!", "pbs"), end_step,
+                 overhead=2*SECONDS_PER_TIP_CHANGE),
+        ]
+
     # Incubate Input Plate @37C for 8 Minutes
-    protocol.pause('Place input culture plate on the Temperature Module for 8 minutes incubation @37C for 0.25% Trypsin-EDTA dissociation!')
-    protocol.delay(minutes=4)
+    if not UNATTENDED_INCUBATION:
+        protocol.pause('Place input culture plate on the Temperature Module for 8 minutes incubation @37C for 0.25% Trypsin-EDTA dissociation!')
+    # Timed from the first trypsin addition when the exposure is equalized, from now otherwise
+    incubation = exposure or IncubationTimer(protocol, minutes=4)
+    if OVERLAP_OUTPUT_PREP:
+        # Prepare the output plate during the first 4 minutes, keeping the mixing pass at the 4 minutes mark
+        output_prep = incubation.run_within(output_prep, until=4)
+    incubation.wait(until=4)
     protocol.comment("Perform mixing while incubating!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
+    liquids.use(p1000_s, "cells")
     p1000_s.pick_up_tip()
+    if exposure:
+        # Mix in the order the trypsin went in, from the 4 minutes mark of the first well on
+        mixing_order = input_addition_order
     for i in range(0, well_num):
         # Aspirate PBS Buffer 500uL/well
-        p1000_s.mix(3, 400, dissociation_plate.wells()[i].bottom(3))
+        p1000_s.mix(3, scale*400, dissociation_plate[mixing_order[i]].bottom(3))
         p1000_s.blow_out()
     p1000_s.drop_tip()
-    protocol.delay(minutes=4)
-    protocol.pause('Complet incubate, place input culture plate to its original location!')
+    if not exposure:
+        incubation = IncubationTimer(protocol, minutes=4)
+    if OVERLAP_OUTPUT_PREP:
+        # Continue preparing the output plate during the last 4 minutes
+        output_prep = incubation.run_within(output_prep)
+    incubation.wait()
+    if not UNATTENDED_INCUBATION:
+        protocol.pause('Complet incubate, place input culture plate to its original location!')
 
     # Perform FBS Neutralization for Input Plate
     protocol.comment("Perform FBS neutralization for input culture plate!")
-    p1000_s.flow_rate.dispense = 175 # Change default dispense speed to 250ul/s
-    for i in range(0, well_num):
-        p1000_s.pick_up_tip()
+    for well in input_addition_order:
+        if exposure:
+            exposure.wait_for(well)
+        tips.pick_up(fbs, input_plate[well])
+        liquids.use(p1000_s, "fbs")
         # Aspirate FBS 250uL/well
-        p1000_s.aspirate(250, fbs.bottom())
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
+        aspirate(p1000_s, scale*250, fbs.bottom(), levels)
         # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense 0.25% Trypsin-EDTA 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(250)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        # Mix 3 times, p1000_s.mix(3, 700)
-        for i in range(0, 5):
-            p1000_s.move_to(adjusted_location_bottom)
-            p1000_s.aspirate(700)
-            p1000_s.move_to(adjusted_location_top)
-            p1000_s.dispense(700)
+        # Dispense FBS 250uL/well at the top y-coordinate and top z-coordinate of the well
+        p1000_s.dispense(scale*250, input_locations.top(well))
+        # Mix between the bottom and the top of the well
+        liquids.use(p1000_s, "cells")
+        mixing(input_locations, well)
         p1000_s.blow_out()
-        p1000_s.drop_tip()
+    tips.drop()
 
     # Collect Neutralization Cell Mixture for Centrifuge
     protocol.comment("Collect neutralization cell mixture for centrifuge!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    for i in range(0, well_num):
-        p1000_s.pick_up_tip()
-        # Get the center of each well.
-        center_location = input_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
+    liquids.use(p1000_s, "cells")
+    for well in input_addition_order:
+        tips.pick_up(input_plate[well], cell_1)
+        # Move to bottom y-coordinate and bottom z-coordinate of the well
+        p1000_s.move_to(input_locations.bottom(well))
         # Collect Cell/0.25% Trypsin-EDTA Mixture 500uL/well
-        p1000_s.mix(1, 700)
-        p1000_s.aspirate(750)
-        p1000_s.dispense(750, cell_1.bottom(15))
+        p1000_s.mix(1, scale*700)
+        p1000_s.aspirate(scale*750)
+        p1000_s.dispense(scale*750, cell_1.bottom(15))
         p1000_s.mix(2, 1000, cell_1.bottom(15))
         p1000_s.blow_out()
-        p1000_s.drop_tip()
+    tips.drop()
     protocol.pause('Optional cell count step & Spin neutralization cell mixture @1000rpm for 4 minutes @4C/RT!')
 
     # Remove Supernatant can be performed manually
@@ -332,133 +475,60 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # Add 12mL RPMI B-27 w/ 2% FBS and 5uM Y27632 to cell pellet (2mL/well)
     protocol.comment("Add 12mL RPMI B-27 w/ 2% FBS and 5uM Y27632 to cell pellet after centrifuge!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    for i in range(0, 6):
-        p1000_s.pick_up_tip()
-        p1000_s.aspirate(1000, media_1.bottom())
-        p1000_s.dispense(1000, cell_1.bottom(2))
+    for i in range(0, resuspension_loads//2):
+        tips.pick_up(resuspension_sources[i], cell_1)
+        liquids.use(p1000_s, "media")
+        aspirate(p1000_s, resuspension_load, resuspension_sources[i].bottom(), levels)
+        p1000_s.dispense(resuspension_load, cell_1.bottom(2))
+        liquids.use(p1000_s, "cells")
         p1000_s.mix(2, 950, cell_1.bottom(15))
         p1000_s.blow_out()
-        p1000_s.drop_tip()
-    for i in range(0, 6):
-        p1000_s.pick_up_tip()
-        p1000_s.aspirate(1000, media_1.bottom())
-        p1000_s.dispense(1000, cell_1.bottom(15))
+    for i in range(resuspension_loads//2, resuspension_loads):
+        tips.pick_up(resuspension_sources[i], cell_1)
+        liquids.use(p1000_s, "media")
+        aspirate(p1000_s, resuspension_load, resuspension_sources[i].bottom(), levels)
+        p1000_s.dispense(resuspension_load, cell_1.bottom(15))
+        liquids.use(p1000_s, "cells")
         p1000_s.mix(2, 950, cell_1.bottom(15))
         p1000_s.blow_out()
-        p1000_s.drop_tip()
-
-    # Remove Fibronection Coating for Output Plate
-    protocol.comment("Remove fibronection coating for output culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(1000)
-        p1000_s.dispense(1000, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    tips.drop()
 
-    # Perform PBS Wash for Output Plate
-    protocol.comment("Perform PBS wash for output culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(500, output_pbs.bottom())
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
-        # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(500)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
-
-    # Remove PBS Wash for Output Plate
-    protocol.comment("Remove PBS wash for output culture plate!")
-    p1000_s.flow_rate.dispense = 500 # Change dispense speed to 500ul/s
-    p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's bottom y-coordinate and bottom z-coordinate from the center of each well.
-        adjusted_location_bottom = center_location.move(types.Point(x_pos, y_pos_low, z_pos_low))
-        # Move to bottom y-coordinate and bottom z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_bottom)
-        # Remove PBS Buffer 500uL/well
-        p1000_s.aspirate(550)
-        p1000_s.dispense(550, waste.top())
-        p1000_s.blow_out()
-    p1000_s.drop_tip()
+    # Prepare the output plate for any steps that did not fit into the incubation
+    for step in output_prep:
+        step()
 
     # Add Cell Mixture for Output Plate
     protocol.comment("Add cell mixture for output culture plate!")
-    p1000_s.flow_rate.dispense = 250 # Change default dispense speed to 250ul/s
+    liquids.use(p1000_s, "seeding")
     p1000_s.pick_up_tip()
-    for i in range(0, well_num):
-        # Aspirate PBS Buffer 500uL/well
-        p1000_s.aspirate(1000, cell_1.bottom(2))
-        # Get the center of each well.
-        center_location = output_plate[well_list[i]].center()
-        # Get a location that's top y-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_top = center_location.move(types.Point(x_pos, y_pos_high, z_pos_high))
-        '''
-        # Get a location that's left x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_left = center_location.move(types.Point(x_pos_left, y_pos, z_pos_high))
-        # Get a location that's right x-coordinate and top z-coordinate from the center of each well.
-        adjusted_location_right = center_location.move(types.Point(x_pos_right, y_pos, z_pos_high))
-        '''
+    if WASTE_PIPETTE:
+        # Remove PBS Buffer 500uL/well right before each well receives the Cell Mixture 1000uL/well, several wells per aspiration
+        p1000_waste.pick_up_tip()
+        exchange(p1000_waste, scale*(PBS_WASH_VOLUME + 50), waste, p1000_s, scale*1000, cell_1.bottom(2), output_locations,
+                 seeding_order)
+        p1000_waste.drop_tip()
+        seeding_order = []
+    for well in seeding_order:
+        # Aspirate Cell Mixture 1000uL/well
+        p1000_s.aspirate(scale*1000, cell_1.bottom(2))
         # Need to divide the dispense into 4 regions, 125uL/region/well ???
-        # Move to top y-coordinate and top z-coordinate from the center of each well.
-        # Dispense PBS Buffer 500uL/well
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(1000)
-        '''
-        p1000_s.move_to(adjusted_location_top)
-        p1000_s.dispense(125)
-        # Move to center of each well.
-        p1000_s.move_to(center_location)
-        p1000_s.dispense(125)
-        # Move to left x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_left)
-        p1000_s.dispense(125)
-        # Move to right x-coordinate and top z-coordinate from the center of each well.
-        p1000_s.move_to(adjusted_location_right)
-        p1000_s.dispense(125)
-        '''
+        # Dispense Cell Mixture 1000uL/well at the top y-coordinate and top z-coordinate of the well
+        p1000_s.dispense(scale*1000, output_locations.top(well))
         p1000_s.blow_out()
     p1000_s.drop_tip()
 
     # Protocol Completed!
+    tip_inventory.check()
+    if WASTE_PIPETTE:
+        waste_inventory.check()
+    protocol.comment(mixing.report())
+    if exposure:
+        protocol.comment(exposure.report())
+    protocol.comment(tips.report())
+    if PLANNED_MOVES:
+        protocol.comment(motion.report())
+    if PROFILE:
+        protocol.comment(profiler.report())
     protocol.comment("Protocol completed! Put plate back into 37C incubator and perform medium change daily until cells are ready for passage ")
     # Turn off robot rail lights
     protocol.set_rail_lights(False)
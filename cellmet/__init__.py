@@ -0,0 +1 @@
+"""Shared helpers for the CELL-MET iPSC-cardiomyocytes OT-2 protocols."""
@@ -0,0 +1,112 @@
+"""Liquid classes: how each kind of liquid is aspirated, dispensed and
+blown out.
+
+Instead of one dispense rate set per protocol section, every transfer
+names the liquid it moves. Reagents dispensed onto attached cells (PBS,
+media, accutase, trypsin) keep the 250 uL/s the scripts have always used
+for them; only their draws from the reservoir run faster. Spent media and
+washes go into the waste at full speed, FBS waits for the tip to fill,
+cell suspensions are collected at the 300 uL/s of the splitting script and
+seeded at its 125 uL/s. Reservoir draws tracked by
+``cellmet.liquids.LiquidLevels`` keep the aspirate rate of their class, up
+to the tracked flow rate of the ledger.
+"""
+
+# Fields of a liquid class that a protocol can change
+FIELDS = ("aspirate", "dispense", "blow_out", "delay")
+
+
+class LiquidClass:
+    """Flow rates (uL/s) for one kind of liquid, and the ``delay`` (s)
+    after every aspiration for the liquid to finish entering the tip."""
+
+    def __init__(self, name, aspirate, dispense, blow_out, delay=0.0):
+        self.name = name
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+        self.delay = delay
+
+    def changed(self, **changes):
+        """A copy of the class with some of its ``FIELDS`` changed."""
+        unknown = set(changes) - set(FIELDS)
+        if unknown:
+            raise ValueError("Liquid classes have no {}".format(
+                ", ".join(sorted(unknown))))
+        fields = {name: getattr(self, name) for name in FIELDS}
+        fields.update(changes)
+        return LiquidClass(self.name, **fields)
+
+    def __repr__(self):
+        return "LiquidClass({}: aspirate {:g}, dispense {:g}, blow out {:g}, " \
+               "delay {:g} s)".format(self.name, self.aspirate, self.dispense,
+                                      self.blow_out, self.delay)
+
+
+LIQUID_CLASSES = {
+    liquid.name: liquid for liquid in (
+        # Dispensed onto the cells from above the well wall, at the rate of
+        # the original scripts
+        LiquidClass("pbs", aspirate=1000, dispense=250, blow_out=1000),
+        LiquidClass("media", aspirate=1000, dispense=250, blow_out=1000),
+        LiquidClass("accutase", aspirate=1000, dispense=250, blow_out=1000),
+        LiquidClass("trypsin", aspirate=1000, dispense=250, blow_out=1000),
+        # Thicker than the buffers and foams when pushed out fast
+        LiquidClass("fbs", aspirate=500, dispense=175, blow_out=500, delay=1.0),
+        # Detached cells: drawn at the P1000 default and pushed out slower,
+        # below the rates the buffers run at
+        LiquidClass("cells", aspirate=500, dispense=300, blow_out=300),
+        # Cell suspension seeded into the output wells, at the seeding rate
+        # of the splitting script
+        LiquidClass("seeding", aspirate=500, dispense=125, blow_out=125),
+        # Drawn at the well wall next to the attached cells, then discarded
+        LiquidClass("waste", aspirate=500, dispense=1000, blow_out=1000),
+    )
+}
+
+
+class LiquidClasses:
+    """The liquid classes of one run, with the changes of the script.
+
+    ``changes`` maps a class name to the fields to change, e.g.
+    ``{"waste": {"dispense": 750}}``. ``use`` sets the flow rates of a
+    pipette for a liquid, and the pipette then waits the delay of that
+    liquid after every aspiration.
+    """
+
+    def __init__(self, protocol, changes=None):
+        self._protocol = protocol
+        self._classes = dict(LIQUID_CLASSES)
+        for name, fields in (changes or {}).items():
+            self._classes[name] = self[name].changed(**fields)
+        self._current = {}
+
+    def __getitem__(self, name):
+        try:
+            return self._classes[name]
+        except KeyError:
+            raise KeyError("Unknown liquid class {!r}, one of {}".format(
+                name, ", ".join(sorted(self._classes))))
+
+    def use(self, pipette, name):
+        """Handle the next transfers of ``pipette`` as liquid ``name``."""
+        liquid = self[name]
+        pipette.flow_rate.aspirate = liquid.aspirate
+        pipette.flow_rate.dispense = liquid.dispense
+        pipette.flow_rate.blow_out = liquid.blow_out
+        if pipette not in self._current:
+            self._wrap_aspirate(pipette)
+        self._current[pipette] = liquid
+        return liquid
+
+    def _wrap_aspirate(self, pipette):
+        original = pipette.aspirate
+
+        def aspirate(*args, **kwargs):
+            result = original(*args, **kwargs)
+            delay = self._current[pipette].delay
+            if delay:
+                self._protocol.delay(seconds=delay)
+            return result
+
+        pipette.aspirate = aspirate
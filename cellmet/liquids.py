@@ -0,0 +1,197 @@
+"""Liquid level tracking for reservoirs, tubes and culture wells.
+
+Drawing reagents from ``well.bottom()`` pushes the whole tip under the
+liquid and forces slow aspirations to avoid pulling air or splashing.
+``LiquidLevels`` keeps a volume ledger per well, turns it into a meniscus
+height from the labware geometry, and aspirates just below the surface so
+reagents can be drawn at a higher flow rate. ``ReagentPlan`` works out
+which reservoir wells each reagent is drawn from, and how much to fill
+them with, before the run.
+"""
+
+import math
+
+# Depth of the tip under the meniscus after an aspiration (mm)
+IMMERSION_DEPTH = 2.0
+# Lowest aspiration height above the well bottom (mm), the Opentrons default
+MIN_CLEARANCE = 1.0
+# Highest aspirate flow rate for tracked aspirations (uL/s); the P1000 default is 500
+TRACKED_ASPIRATE_FLOW_RATE = 1000
+# Height of the conical bottom of Falcon tubes (mm)
+CONICAL_BOTTOM_HEIGHT = 22.0
+# Height of the V-shaped bottom of the USA Scientific 12-well reservoir troughs (mm): what makes a 42.16 mm deep,
+# 8.33 x 71.88 mm trough hold its 22 mL, with the walls narrowing to a line at the bottom
+V_BOTTOM_HEIGHT = 10.8
+# Reservoirs whose wells have that V-shaped bottom
+V_BOTTOM_RESERVOIRS = ("usascientific_12_reservoir_22ml",)
+# Share of the volume of a reservoir well filled at most, so the well is not filled to the brim
+MAX_FILL_FRACTION = 0.9
+
+
+def _well(place):
+    """The well a Well or Location refers to, or None."""
+    labware = getattr(place, "labware", place)
+    # Newer API versions wrap the labware of a Location in a LabwareLike
+    labware = getattr(labware, "object", labware)
+    return labware if hasattr(labware, "depth") else None
+
+
+class LiquidLevels:
+    """Volume ledger of wells and the meniscus heights it implies."""
+
+    def __init__(self, immersion=IMMERSION_DEPTH,
+                 flow_rate=TRACKED_ASPIRATE_FLOW_RATE):
+        self.immersion = immersion
+        self.flow_rate = flow_rate
+        self._volumes = {}
+
+    def fill(self, well, volume):
+        """Set the volume (uL) held by ``well``."""
+        if volume > well.max_volume:
+            raise ValueError("{} uL overfills {} ({} uL)".format(
+                volume, well, well.max_volume))
+        self._volumes[well] = volume
+
+    def volume(self, well):
+        return self._volumes.get(well, 0.0)
+
+    def add(self, place, volume):
+        """Record ``volume`` dispensed at ``place`` (a Well or Location)."""
+        well = _well(place)
+        if well is not None:
+            self._volumes[well] = self.volume(well) + volume
+
+    def remove(self, well, volume):
+        """Record ``volume`` taken out of ``well``."""
+        if volume > self.volume(well) + 1e-6:
+            raise ValueError("{} holds {:.0f} uL, cannot take {:.0f} uL".format(
+                well, self.volume(well), volume))
+        self._volumes[well] = self.volume(well) - volume
+
+    def height(self, well, volume=None):
+        """Meniscus height (mm) above the bottom of ``well``."""
+        if volume is None:
+            volume = self.volume(well)
+        if well.diameter is None:
+            area = well.length * well.width
+        else:
+            area = math.pi * (well.diameter / 2) ** 2
+        load_name = getattr(well.parent, "load_name", "")
+        if "conical" in load_name:
+            cone = area * CONICAL_BOTTOM_HEIGHT / 3
+            if volume < cone:
+                return CONICAL_BOTTOM_HEIGHT * (volume / cone) ** (1 / 3)
+            return min(well.depth,
+                       CONICAL_BOTTOM_HEIGHT + (volume - cone) / area)
+        if load_name in V_BOTTOM_RESERVOIRS:
+            vee = area * V_BOTTOM_HEIGHT / 2
+            if volume < vee:
+                return V_BOTTOM_HEIGHT * (volume / vee) ** (1 / 2)
+            return min(well.depth, V_BOTTOM_HEIGHT + (volume - vee) / area)
+        return min(well.depth, volume / area)
+
+    def location(self, well, volume):
+        """Where to aspirate ``volume`` from ``well``: just under the
+        meniscus it leaves behind."""
+        height = self.height(well, max(0.0, self.volume(well) - volume))
+        return well.bottom(max(MIN_CLEARANCE, height - self.immersion))
+
+    def aspirate(self, pipette, volume, source):
+        """Aspirate ``volume`` from the well of ``source`` (a Well or any
+        Location in it) at the tracked height, and record it in the ledger.
+        The flow rate of the pipette is kept up to the tracked flow rate.
+        Every channel of a multi-channel pipette draws ``volume`` from the
+        same (reservoir) well."""
+        well = _well(source)
+        self.remove(well, volume * getattr(pipette, "channels", 1))
+        location = self.location(well, 0)
+        pipette.aspirate(volume, location,
+                         rate=min(1.0, self.flow_rate / pipette.flow_rate.aspirate))
+
+    def dispense(self, pipette, volume, location):
+        """Dispense ``volume`` at ``location`` and record it in the ledger."""
+        pipette.dispense(volume, location)
+        self.add(location, volume)
+
+
+def aspirate(pipette, volume, source, levels=None):
+    """Aspirate ``volume`` from ``source``, tracking the liquid level with
+    the ``levels`` ledger when one is given."""
+    if levels is None:
+        pipette.aspirate(volume, source)
+    else:
+        levels.aspirate(pipette, volume, source)
+
+
+def assign_sources(sources, volumes, overage=0.1):
+    """Spread ``volumes`` over the reservoir wells ``sources``, in order.
+
+    Every volume (plus ``overage``) is drawn from a single well, and a well
+    is used until the next volume no longer fits in the ``MAX_FILL_FRACTION``
+    of it. Returns the source of each volume, and a dict of the volume each
+    source must be filled with. Raises ValueError when the sources run out.
+    """
+    assignment = []
+    fills = {}
+    sources = iter(sources)
+    current = None
+    for volume in volumes:
+        needed = volume * (1 + overage)
+        while (current is None or fills[current] + needed
+               > current.max_volume * MAX_FILL_FRACTION + 1e-6):
+            current = next(sources, None)
+            if current is None:
+                raise ValueError(
+                    "Not enough reservoir wells for {} volumes of up to "
+                    "{:.0f} uL".format(len(volumes), max(volumes)))
+            fills[current] = 0.0
+        fills[current] += needed
+        assignment.append(current)
+    return assignment, {well: volume for well, volume in fills.items() if volume}
+
+
+# First words of the fill sheet comment
+FILL_SHEET_TITLE = "Fill sheet"
+
+
+class ReagentPlan:
+    """The reservoir wells each reagent of a run is drawn from, and the
+    volumes to fill them with before the run.
+
+    Every reagent is planned over the wells set aside for it from the
+    volumes the protocol draws from it, one volume per draw from a single
+    well, with ``assign_sources``: a reagent that outgrows its first well
+    continues in the next one instead of running dry mid-run.
+    """
+
+    def __init__(self, overage=0.1):
+        self.overage = overage
+        self._reagents = []
+
+    def add(self, name, wells, volumes):
+        """Plan reagent ``name`` over ``wells`` for the draws ``volumes``
+        (uL); returns the well of each draw. Raises ValueError when the
+        wells cannot hold them."""
+        sources, fills = assign_sources(wells, volumes, self.overage)
+        self._reagents.append((name, fills))
+        return sources
+
+    def fills(self):
+        """The volume (uL) to fill each planned well with."""
+        return {well: volume for _, fills in self._reagents
+                for well, volume in fills.items()}
+
+    def fill(self, levels):
+        """Start the ``levels`` ledger with the planned volumes."""
+        for well, volume in self.fills().items():
+            levels.fill(well, volume)
+
+    def fill_sheet(self):
+        """The wells to fill, reagent by reagent, as text for the operator."""
+        lines = ["{} (draws plus the {:.0f}% overage the tracked aspirations "
+                 "need)".format(FILL_SHEET_TITLE, self.overage * 100)]
+        for name, fills in self._reagents:
+            for well, volume in fills.items():
+                lines.append("{} {}: {} {:.0f} uL".format(
+                    well.parent.name, well.well_name, name, volume))
+        return "\n".join(lines)
@@ -0,0 +1,155 @@
+"""Motion profiles: how the gantry travels between pipetting points.
+
+The default move planning lifts the tip before every move to a location it
+is not already at: a few millimetres over the labware between its wells,
+and over the tallest labware on the deck between labware. Most moves of
+the protocols go from the bottom to the top of one well, or to the next
+well of the same plate. ``MotionProfile`` plans these itself: a straight
+move inside a well, a low hop just clear of the plate between wells of one
+labware, and the default arc only when crossing to other labware. Each
+kind of move can have its own speed cap.
+"""
+
+from opentrons import types
+
+from cellmet.liquids import _well
+
+# Height of the hops between wells of one labware above its top (mm)
+PLATE_CLEARANCE = 2.0
+# Kinds of moves a profile plans, with their own speed caps
+SEGMENTS = ("well", "plate", "deck")
+# Pipette calls after which the position of the pipette is not known
+_MOVING_CALLS = ("pick_up_tip", "drop_tip", "return_tip", "touch_tip")
+
+
+class MotionProfile:
+    """Plans the moves of the pipettes it is applied to.
+
+    ``speeds`` maps a kind of move in ``SEGMENTS`` to its speed cap (mm/s):
+    ``well`` for moves inside one well, ``plate`` for hops between wells of
+    one labware and ``deck`` for moves to other labware; kinds without a cap
+    move at the default speed. ``apply`` makes a pipette route its
+    ``move_to``, and the moves of ``aspirate``, ``dispense``, ``blow_out``
+    and ``mix`` to an explicit location, through the profile. A move of any
+    of these pipettes leaves the position of the others unknown, so their
+    next move takes the default arc.
+    """
+
+    def __init__(self, clearance=PLATE_CLEARANCE, speeds=None):
+        speeds = dict(speeds or {})
+        unknown = set(speeds) - set(SEGMENTS)
+        if unknown:
+            raise ValueError("Motion profiles have no {} moves, only {}".format(
+                ", ".join(sorted(unknown)), ", ".join(SEGMENTS)))
+        self.clearance = clearance
+        self.speeds = speeds
+        self.moves = dict.fromkeys(SEGMENTS, 0)
+        self._locations = {}
+
+    def segment(self, start, end):
+        """The kind of move from location ``start`` (None when unknown) to
+        location ``end``."""
+        here = _well(start) if start is not None else None
+        there = _well(end)
+        if here is None or there is None:
+            return "deck"
+        if here == there:
+            return "well"
+        if here.parent is there.parent:
+            return "plate"
+        return "deck"
+
+    def apply(self, *pipettes):
+        """Route the moves of ``pipettes`` through the profile."""
+        for pipette in pipettes:
+            self._locations[pipette] = None
+            move_to = pipette.move_to
+
+            def planned_move_to(location, force_direct=False,
+                                minimum_z_height=None, speed=None,
+                                pipette=pipette, move_to=move_to):
+                if force_direct or minimum_z_height is not None:
+                    self._moved(pipette, location)
+                    return move_to(location, force_direct=force_direct,
+                                   minimum_z_height=minimum_z_height,
+                                   speed=speed)
+                return self._move(pipette, move_to, location, speed)
+
+            pipette.move_to = planned_move_to
+            for name in ("aspirate", "dispense"):
+                self._wrap_liquid(pipette, name)
+            self._wrap_located(pipette, "blow_out", 0)
+            self._wrap_located(pipette, "mix", 2)
+            for name in _MOVING_CALLS:
+                self._wrap_moving(pipette, name)
+
+    def _move(self, pipette, move_to, location, speed=None):
+        start = self._locations[pipette]
+        segment = self.segment(start, location)
+        if speed is None:
+            speed = self.speeds.get(segment)
+        self.moves[segment] += 1
+        self._moved(pipette, location)
+        if segment == "deck":
+            return move_to(location, speed=speed)
+        if segment == "plate":
+            plate = _well(location).parent
+            safe = max(start.point.z, location.point.z,
+                       plate.highest_z + self.clearance)
+            move_to(start.move(types.Point(0, 0, safe - start.point.z)),
+                    force_direct=True, speed=speed)
+            move_to(location.move(types.Point(0, 0, safe - location.point.z)),
+                    force_direct=True, speed=speed)
+        return move_to(location, force_direct=True, speed=speed)
+
+    def _moved(self, pipette, location):
+        """Record that ``pipette`` moved to ``location`` (None when unknown);
+        the gantry moved with it, so the other pipettes are elsewhere now."""
+        for other in self._locations:
+            self._locations[other] = None
+        self._locations[pipette] = location
+
+    def _planned(self, pipette, location):
+        """Move to ``location`` through the profile when it is a Location,
+        and return what the wrapped call should get as its location."""
+        if location is None or not hasattr(location, "point"):
+            if location is not None:
+                self._moved(pipette, None)
+            return location
+        pipette.move_to(location)
+        return None
+
+    def _wrap_liquid(self, pipette, name):
+        original = getattr(pipette, name)
+
+        def call(volume=None, location=None, rate=1.0):
+            return original(volume, self._planned(pipette, location), rate)
+
+        setattr(pipette, name, call)
+
+    def _wrap_located(self, pipette, name, index):
+        original = getattr(pipette, name)
+
+        def call(*args, **kwargs):
+            args = list(args)
+            if len(args) > index:
+                args[index] = self._planned(pipette, args[index])
+            elif "location" in kwargs:
+                kwargs["location"] = self._planned(pipette, kwargs["location"])
+            return original(*args, **kwargs)
+
+        setattr(pipette, name, call)
+
+    def _wrap_moving(self, pipette, name):
+        original = getattr(pipette, name)
+
+        def call(*args, **kwargs):
+            self._moved(pipette, None)
+            return original(*args, **kwargs)
+
+        setattr(pipette, name, call)
+
+    def report(self):
+        return "Motion profile: {} moves inside wells, {} hops between wells " \
+               "of a plate, {} moves across the deck".format(
+                   self.moves["well"], self.moves["plate"], self.moves["deck"])
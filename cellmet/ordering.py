@@ -0,0 +1,200 @@
+"""Well visit orders that cut gantry travel.
+
+The protocols walk the wells of a plate once per phase, going back to a
+fixed place between trips: the waste reservoir when removing liquid, the
+reagent reservoir when adding it. ``order_wells`` picks the visit order of
+a phase that keeps the XY travel of that route shortest, using the deck
+positions of the plate and of the places it returns to.
+"""
+
+import itertools
+import math
+
+# Largest number of wells searched exhaustively; larger plates are ordered
+# with the serpentine and nearest-neighbour heuristics.
+EXACT_SEARCH_LIMIT = 10
+
+# Wells whose centres are closer than this in y share a row (mm)
+ROW_TOLERANCE = 1.0
+
+
+def _xy(place):
+    """XY deck position of a Location, Well or Labware."""
+    point = getattr(place, "point", None)
+    if point is None:
+        if hasattr(place, "center"):
+            point = place.center().point
+        else:
+            points = [well.center().point for well in place.wells()]
+            return (sum(p.x for p in points) / len(points),
+                    sum(p.y for p in points) / len(points))
+    return point.x, point.y
+
+
+def _place(place):
+    return None if place is None else _xy(place)
+
+
+def _distance(a, b):
+    if a is None or b is None:
+        return 0.0
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+class _Route:
+    """Travel cost of visiting points in order, see ``order_wells``."""
+
+    def __init__(self, points, start, end, anchor, trips):
+        self.points = points
+        self.start = start
+        self.end = end
+        self.anchor = anchor
+        # Visit positions a trip from the anchor starts at, and the extra
+        # round trips to the anchor from the point at each position
+        self.breaks = set()
+        self.returns = [0] * len(points)
+        last = None
+        for trip in trips:
+            if last is not None:
+                if trip[0] == last:
+                    self.returns[last] += 1
+                else:
+                    self.breaks.add(trip[0])
+            last = trip[-1]
+
+    def step(self, previous, index, visited):
+        """Travel to point ``index`` after ``visited`` points, the last
+        being ``previous`` (None before the first)."""
+        target = self.points[index]
+        if previous is None:
+            travel = _distance(self.start, target)
+        elif self.anchor is not None and visited in self.breaks:
+            here = self.points[previous]
+            travel = _distance(here, self.anchor) + _distance(self.anchor, target)
+        else:
+            travel = _distance(self.points[previous], target)
+        if self.anchor is not None and self.returns[visited]:
+            travel += 2 * self.returns[visited] * _distance(target, self.anchor)
+        return travel
+
+    def finish(self, last):
+        return _distance(self.points[last], self.end)
+
+    def length(self, order):
+        total = 0.0
+        previous = None
+        for visited, index in enumerate(order):
+            total += self.step(previous, index, visited)
+            previous = index
+        return total + self.finish(previous) if order else 0.0
+
+
+def _serpentine(route):
+    rows = []
+    for index in sorted(range(len(route.points)),
+                        key=lambda i: -route.points[i][1]):
+        if rows and abs(route.points[rows[-1][0]][1]
+                        - route.points[index][1]) < ROW_TOLERANCE:
+            rows[-1].append(index)
+        else:
+            rows.append([index])
+    candidates = []
+    for flip in (False, True):
+        priority = []
+        for number, row in enumerate(rows):
+            row.sort(key=lambda i: route.points[i][0])
+            priority.extend(reversed(row) if (number % 2) ^ flip else row)
+        candidates.append(priority)
+        candidates.append(priority[::-1])
+    return min(candidates, key=route.length)
+
+
+def _nearest(route):
+    order = []
+    done = set()
+    while len(order) < len(route.points):
+        available = [i for i in range(len(route.points)) if i not in done]
+        previous = order[-1] if order else None
+        index = min(available,
+                    key=lambda i: route.step(previous, i, len(order)))
+        order.append(index)
+        done.add(index)
+    return order
+
+
+def _exact(route):
+    """Shortest order by dynamic programming over the visited sets."""
+    count = len(route.points)
+    best = {}
+    for index in range(count):
+        best[(1 << index, index)] = (route.step(None, index, 0), None)
+    for visited in range(1, count):
+        for mask in itertools.combinations(range(count), visited):
+            subset = sum(1 << i for i in mask)
+            for last in mask:
+                entry = best.get((subset, last))
+                if entry is None:
+                    continue
+                for index in range(count):
+                    if subset & (1 << index):
+                        continue
+                    cost = entry[0] + route.step(last, index, visited)
+                    key = (subset | (1 << index), index)
+                    if key not in best or cost < best[key][0]:
+                        best[key] = (cost, last)
+    full = (1 << count) - 1
+    ends = [(best[(full, last)][0] + route.finish(last), last)
+            for last in range(count)]
+    order = []
+    subset, last = full, min(ends)[1]
+    while last is not None:
+        order.append(last)
+        previous = best[(subset, last)][1]
+        subset &= ~(1 << last)
+        last = previous
+    return order[::-1]
+
+
+METHODS = {
+    "serpentine": _serpentine,
+    "nearest": _nearest,
+    "exact": _exact,
+}
+
+
+def order_wells(plate, wells, start=None, end=None, anchor=None,
+                per_trip=1, method="auto", trips=None):
+    """Order the ``wells`` (names) of ``plate`` to cut gantry travel.
+
+    The route starts at ``start``, visits the wells ``per_trip`` at a time
+    and goes back to ``anchor`` between trips (the waste when removing
+    liquid, the source when distributing), then ends at ``end``. Places are
+    Locations, Wells or Labware; any of them may be None to leave it out.
+    ``trips`` replaces ``per_trip`` with the visit positions of every trip,
+    such as ``cellmet.transfers.trip_positions`` plans them for volumes
+    split over several trips.
+
+    ``method`` is "serpentine", "nearest", "exact" or "auto" (exact search
+    up to ``EXACT_SEARCH_LIMIT`` wells, else the best heuristic). Returns
+    the well names in visit order.
+    """
+    wells = list(wells)
+    if not wells:
+        return wells
+    if trips is None:
+        per_trip = max(1, per_trip)
+        trips = [list(range(first, min(first + per_trip, len(wells))))
+                 for first in range(0, len(wells), per_trip)]
+    route = _Route([_xy(plate[name]) for name in wells],
+                   _place(start), _place(end), _place(anchor), trips)
+    if method == "auto":
+        if len(wells) <= EXACT_SEARCH_LIMIT:
+            order = _exact(route)
+        else:
+            order = min((_serpentine(route), _nearest(route)),
+                        key=route.length)
+    elif method in METHODS:
+        order = METHODS[method](route)
+    else:
+        raise ValueError("Unknown ordering method {!r}".format(method))
+    return [wells[index] for index in order]
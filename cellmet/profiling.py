@@ -0,0 +1,149 @@
+"""Time and call counts of pipette and protocol calls per protocol section.
+
+``Profiler`` wraps the liquid handling calls of every pipette loaded after
+it is created, and ``protocol.delay`` and ``protocol.pause``, and charges
+their time to the section opened by the last ``protocol.comment``. Calls
+made inside other calls (the aspirations of a ``mix``) are nested under
+them, so the result reads like a flame graph: ``report()`` renders it as an
+indented tree and ``folded()`` as folded stacks for flame graph tools.
+
+On the robot the clock is the wall clock. Dry runs pass a clock that
+returns the estimated time of the commands recorded so far.
+"""
+
+import collections
+import time
+
+INSTRUMENT_CALLS = ("aspirate", "dispense", "move_to", "blow_out", "mix",
+                    "pick_up_tip", "drop_tip")
+PROTOCOL_CALLS = ("delay", "pause")
+
+# Time between the wrapped calls of a section, such as module commands
+OTHER = "(other)"
+# Width of the bars in the report (characters)
+BAR_WIDTH = 30
+
+
+class Profiler:
+    """Profiles the calls made through ``protocol`` and its pipettes."""
+
+    def __init__(self, protocol, clock=time.monotonic):
+        self.clock = clock
+        self.section = "Setup"
+        self.sections = collections.OrderedDict()
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self._stack = []
+        self._section_start = clock()
+        for name in PROTOCOL_CALLS:
+            self._wrap(protocol, name)
+        self._wrap_comment(protocol)
+        self._wrap_load_instrument(protocol)
+
+    def attach(self, *instruments):
+        """Profile the calls of ``instruments`` loaded before the profiler."""
+        for instrument in instruments:
+            for name in INSTRUMENT_CALLS:
+                self._wrap(instrument, name)
+
+    def _wrap(self, target, name):
+        original = getattr(target, name)
+
+        def profiled(*args, **kwargs):
+            frame = [name, self.clock(), 0.0]
+            self._stack.append(frame)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._stack.pop()
+                total = self.clock() - frame[1]
+                path = (self.section,) + tuple(f[0] for f in self._stack) + (name,)
+                self.seconds[path] += total - frame[2]
+                self.calls[path] += 1
+                if self._stack:
+                    self._stack[-1][2] += total
+
+        setattr(target, name, profiled)
+
+    def _wrap_comment(self, protocol):
+        original = protocol.comment
+
+        def comment(msg, *args, **kwargs):
+            self._close_section()
+            self.section = msg
+            return original(msg, *args, **kwargs)
+
+        protocol.comment = comment
+
+    def _wrap_load_instrument(self, protocol):
+        original = protocol.load_instrument
+
+        def load_instrument(*args, **kwargs):
+            instrument = original(*args, **kwargs)
+            self.attach(instrument)
+            return instrument
+
+        protocol.load_instrument = load_instrument
+
+    def _close_section(self):
+        now = self.clock()
+        self.sections[self.section] = (self.sections.get(self.section, 0.0)
+                                       + now - self._section_start)
+        self._section_start = now
+
+    def _tree(self):
+        """Nested ``{name: [seconds, calls, children]}`` per section, with
+        the unaccounted section time under ``OTHER``."""
+        self._close_section()
+        tree = collections.OrderedDict(
+            (section, [0.0, 0, {}]) for section in self.sections)
+        for path, seconds in self.seconds.items():
+            node = tree.setdefault(path[0], [0.0, 0, {}])
+            node[0] += seconds
+            for name in path[1:]:
+                node = node[2].setdefault(name, [0.0, 0, {}])
+                node[0] += seconds
+            node[1] += self.calls[path]
+        for section, node in tree.items():
+            other = self.sections.get(section, 0.0) - node[0]
+            if other > 1e-6:
+                node[2][OTHER] = [other, 0, {}]
+                node[0] += other
+        return tree
+
+    def folded(self):
+        """Folded stacks, one ``section;call;call milliseconds`` line per
+        call path, as read by flamegraph.pl and speedscope."""
+        lines = []
+        for path, seconds in self.seconds.items():
+            lines.append("{} {}".format(
+                ";".join(name.replace(";", ",") for name in path),
+                int(round(seconds * 1000))))
+        for section, node in self._tree().items():
+            other = node[2].get(OTHER)
+            if other is not None:
+                lines.append("{};{} {}".format(section.replace(";", ","), OTHER,
+                                               int(round(other[0] * 1000))))
+        return "\n".join(lines)
+
+    def report(self):
+        """An indented breakdown of seconds and calls per section and call."""
+        tree = self._tree()
+        total = sum(node[0] for node in tree.values()) or 1.0
+        lines = ["Profile: {:.0f} s".format(total)]
+
+        def render(name, node, depth):
+            seconds, calls, children = node
+            bar = "#" * int(round(BAR_WIDTH * seconds / total))
+            label = "  " * depth + name[:48 - 2 * depth]
+            count = "{:>5}x".format(calls) if calls else "      "
+            lines.append("{:<48} {:>8.1f} s {} {}".format(
+                label, seconds, count, bar).rstrip())
+            for child, grandchild in sorted(children.items(),
+                                            key=lambda item: -item[1][0]):
+                render(child, grandchild, depth + 1)
+
+        for section, node in tree.items():
+            if node[0] > 0 or node[2]:
+                render(section, node, 0)
+        return "\n".join(lines)
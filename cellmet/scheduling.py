@@ -0,0 +1,278 @@
+"""Time-aware scheduling of protocol steps inside incubation windows.
+
+Incubations such as the accutase or trypsin dissociation leave the robot
+idle. Independent work (for example preparing the output plate) can be
+packed into that window, as long as it never pushes the next time-critical
+step past its mark. The estimates of the steps are rough, so a step only
+starts with a safety margin left, and it runs in parts (a well to empty, a
+load of wells to fill) that are only started with the margin left either:
+a step reaching the mark stops between two parts and is finished after
+the incubation.
+
+The wells of a plate receive the reagent one after the other and are
+collected one after the other, so a single timer started after the last
+addition exposes the first wells longer than the last ones.
+``ExposureTimer`` times every well from its own addition and paces the
+additions to the rate the wells are collected at, so that every well is
+exposed for the same time.
+"""
+
+import functools
+import time
+
+from cellmet.tips import SECONDS_PER_TIP_CHANGE
+from cellmet.transfers import trip_positions
+from cellmet.wells import add_from_reservoir, exchange, remove_to_waste
+
+# Conservative duration of one P1000 round trip (aspirate, travel, dispense,
+# blow out) in seconds, used to estimate whether a step still fits.
+SECONDS_PER_TRIP = 12.0
+# Duration of one dispense of a multi-dispense trip in seconds, the time an
+# addition takes per well when simulating.
+SECONDS_PER_DISPENSE = 2.0
+# Share of its estimate added to a step or part before checking that it fits
+# into the time left, for the steps that run slower than estimated.
+SAFETY_MARGIN = 0.25
+
+
+def step_seconds(trips, dispenses=0, tips=1):
+    """Conservative duration (s) of a step of ``trips`` pipette round trips
+    with ``dispenses`` dispenses in all and ``tips`` tip changes."""
+    return (trips * SECONDS_PER_TRIP + dispenses * SECONDS_PER_DISPENSE
+            + tips * SECONDS_PER_TIP_CHANGE)
+
+
+def removal_parts(pipette, locations, wells, volume, waste, repeats=1):
+    """``remove_to_waste`` as ``Step`` parts, one well each."""
+    return [(functools.partial(remove_to_waste, pipette, locations, [well],
+                               volume, waste, repeats),
+             step_seconds(repeats, repeats, tips=0))
+            for well in wells]
+
+
+def _loads(pipette, volume, wells, disposal_volume):
+    """The wells of every load of ``distribute``, with the trips and the
+    dispenses of the load; the loads a well's volume is split over are
+    one."""
+    groups = []
+    for trip in trip_positions(pipette, volume, len(wells), disposal_volume):
+        if not groups or trip[0] != groups[-1][0][-1]:
+            groups.append([[], 0, 0])
+        positions = groups[-1][0]
+        positions.extend(p for p in dict.fromkeys(trip) if p not in positions)
+        groups[-1][1] += 1
+        groups[-1][2] += len(trip)
+    return [([wells[p] for p in positions], trips, dispenses)
+            for positions, trips, dispenses in groups]
+
+
+def addition_parts(pipette, volume, source, locations, wells,
+                   disposal_volume=0, levels=None):
+    """``add_from_reservoir`` as ``Step`` parts, one load of wells each."""
+    return [(functools.partial(add_from_reservoir, pipette, volume, source,
+                               locations, load, disposal_volume=disposal_volume,
+                               levels=levels),
+             step_seconds(trips, dispenses, tips=0))
+            for load, trips, dispenses in _loads(pipette, volume, wells,
+                                                 disposal_volume)]
+
+
+def exchange_parts(waste_pipette, removal_volume, waste, pipette, volume,
+                   source, locations, wells, repeats=1, disposal_volume=0,
+                   levels=None):
+    """``cellmet.wells.exchange`` as ``Step`` parts, one load of wells each
+    with their removals."""
+    return [(functools.partial(exchange, waste_pipette, removal_volume, waste,
+                               pipette, volume, source, locations, load,
+                               repeats=repeats, disposal_volume=disposal_volume,
+                               levels=levels),
+             step_seconds(trips + len(load) * repeats,
+                          dispenses + len(load) * repeats, tips=0))
+            for load, trips, dispenses in _loads(pipette, volume, wells,
+                                                 disposal_volume)]
+
+
+class Step:
+    """A deferrable block of protocol work with an estimated duration.
+
+    The work is a list of ``parts``, ``(action, seconds)`` pairs, run after
+    ``begin`` and before ``end`` (picking up and dropping the tip, the
+    ``overhead`` seconds of the step). ``IncubationTimer.run_within`` can
+    stop a step between two parts; calling the step again runs the parts
+    left, with its own ``begin`` and ``end``. A part only starts when the
+    ``overhead`` still fits after it, to end the step and pick up the tip
+    of the next one.
+    """
+
+    def __init__(self, name, parts, begin=None, end=None,
+                 overhead=SECONDS_PER_TIP_CHANGE):
+        self.name = name
+        self.parts = list(parts)
+        self.begin = begin
+        self.end = end
+        self.overhead = overhead
+
+    @property
+    def seconds(self):
+        """Estimated seconds of the parts left."""
+        if not self.parts:
+            return 0.0
+        return self.overhead + sum(seconds for _, seconds in self.parts)
+
+    @property
+    def first_seconds(self):
+        """Estimated seconds to start the step and run its next part."""
+        if not self.parts:
+            return 0.0
+        return self.overhead + self.parts[0][1]
+
+    def __call__(self, admit=None):
+        """Run the parts left. With ``admit``, every part after the first
+        runs only if ``admit(seconds, overhead)`` allows it. Returns whether
+        the step is done."""
+        if not self.parts:
+            return True
+        if self.begin is not None:
+            self.begin()
+        first = True
+        while self.parts:
+            action, seconds = self.parts[0]
+            if not first and admit is not None and not admit(seconds, self.overhead):
+                break
+            self.parts.pop(0)
+            action()
+            first = False
+        if self.end is not None:
+            self.end()
+        return not self.parts
+
+
+class IncubationTimer:
+    """Clock for an incubation, started when the timer is created.
+
+    On the robot the clock follows the wall clock. During simulation delays
+    are skipped: the dry runs of ``cellmet.sim`` follow the estimated time of
+    the commands run so far, and other simulations advance the clock by the
+    estimate of each step run instead.
+    """
+
+    def __init__(self, protocol, minutes):
+        self._protocol = protocol
+        self._clock = getattr(protocol, "clock", None)
+        if self._clock is None and not protocol.is_simulating():
+            self._clock = time.monotonic
+        self._start = self._now()
+        self._simulated = 0.0
+        self.minutes = minutes
+
+    def _now(self):
+        return self._clock() if self._clock else 0.0
+
+    def elapsed(self):
+        """Seconds since the incubation started."""
+        if self._clock is None:
+            return self._simulated
+        return self._clock() - self._start
+
+    def remaining(self, until=None):
+        """Seconds left until ``until`` minutes (default: the end)."""
+        deadline = self.minutes if until is None else until
+        return max(0.0, deadline * 60 - self.elapsed())
+
+    def admit(self, seconds, reserve=0.0, until=None):
+        """Whether work estimated at ``seconds``, and ``reserve`` seconds
+        after it, still fit before the deadline with the ``SAFETY_MARGIN``;
+        the work is counted as run when it fits."""
+        if (seconds + reserve) * (1 + SAFETY_MARGIN) > self.remaining(until):
+            return False
+        self._simulated += seconds
+        return True
+
+    def run_within(self, steps, until=None):
+        """Run steps in order while they fit before the deadline.
+
+        A step starts only when its first part fits, and every later part
+        runs only when it fits too (see ``admit``). Stops at the first step
+        that does not fit completely so that the order of the steps is
+        preserved, and returns the steps, or the parts of a step, that were
+        not run.
+        """
+        steps = list(steps)
+
+        def admit(seconds, reserve):
+            return self.admit(seconds, reserve, until)
+
+        while steps:
+            step = steps[0]
+            left = self.remaining(until)
+            if not admit(step.first_seconds, step.overhead):
+                break
+            self._protocol.comment(
+                "Run '{}' during incubation ({:.0f}s left)".format(
+                    step.name, left))
+            if not step(admit):
+                self._protocol.comment(
+                    "Finish '{}' after the incubation".format(step.name))
+                break
+            steps.pop(0)
+        return steps
+
+    def wait(self, until=None):
+        """Delay until ``until`` minutes (default: the end) have passed."""
+        seconds = self.remaining(until)
+        if seconds > 0:
+            self._protocol.delay(seconds=seconds)
+        self._simulated = max(self._simulated,
+                              (self.minutes if until is None else until) * 60)
+
+
+class ExposureTimer(IncubationTimer):
+    """An incubation timed per well from the moment the well receives the
+    reagent.
+
+    Call ``add`` right before each dispense of the reagent; the clock starts
+    at the first well. The additions are paced ``interval`` seconds apart,
+    the time the step ending the exposure (collection or neutralization)
+    takes per well. Running that step in the addition order, with
+    ``wait_for`` before each well, then exposes every well for ``minutes``.
+    ``run_within`` and ``wait`` work up to the mark of the first well, which
+    is collected first. When the first well is reached past its mark (the
+    additions of a plate with many wells can outlast the incubation), every
+    later well is held back as long, so the exposures stay equal.
+    """
+
+    def __init__(self, protocol, minutes, interval):
+        super().__init__(protocol, minutes)
+        self.interval = interval
+        self.added = {}
+        self.exposures = {}
+        self.overrun = None
+
+    def add(self, well):
+        """Wait for the turn of ``well`` and record its addition."""
+        if well in self.added:
+            return
+        if not self.added:
+            self._start = self._now()
+            self._simulated = 0.0
+        self.wait(until=len(self.added) * self.interval / 60)
+        self.added[well] = self.elapsed()
+        self._simulated += SECONDS_PER_DISPENSE
+
+    def wait_for(self, well, minutes=None):
+        """Delay until ``well`` has been exposed for ``minutes`` (default:
+        the whole incubation), before a step of ``interval`` seconds on it."""
+        minutes = self.minutes if minutes is None else minutes
+        if self.overrun is None:
+            self.overrun = max(0.0, self.elapsed() - self.added[well] - minutes * 60)
+        self.wait(until=(self.added[well] + self.overrun) / 60 + minutes)
+        self.exposures[well] = self.elapsed() - self.added[well]
+        self._simulated += self.interval
+
+    def report(self):
+        if not self.exposures:
+            return "Exposure per well: no wells collected"
+        return "Exposure per well: {:.0f} to {:.0f} s over {} wells " \
+               "(target {:.0f} s, additions {:.0f} s apart)".format(
+                   min(self.exposures.values()), max(self.exposures.values()),
+                   len(self.exposures), self.minutes * 60, self.interval)
@@ -0,0 +1 @@
+"""Offline dry runs and runtime estimates for the protocols in Protocols/."""
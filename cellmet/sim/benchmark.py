@@ -0,0 +1,144 @@
+"""Golden trace regression checks for the protocols in Protocols/.
+
+Each script is dry-run with its default settings and summarised as a trace:
+command counts by kind, tips used, volume aspirated per source well and
+the estimated seconds per phase. The traces are compared with the golden
+traces stored in ``benchmarks/``, and the check fails when a protocol or
+any of its phases got slower, or it uses more tips or draws more from a
+source, than its golden trace by more than the tolerance.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.benchmark            # check every protocol
+    python -m cellmet.sim.benchmark --update   # accept the current traces
+"""
+
+import argparse
+import collections
+import glob
+import json
+import os
+import sys
+
+from cellmet.sim.common import channels, tips_used
+from cellmet.sim.context import run_protocol
+from cellmet.sim.estimate import estimate_commands
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+PROTOCOLS = os.path.join(ROOT, "Protocols")
+GOLDEN = os.path.join(ROOT, "benchmarks")
+
+# Allowed relative increase of runtime, tips and source volumes
+TOLERANCE = 0.02
+
+
+def trace(path):
+    """Dry-run the script at ``path`` and summarise it as a dict."""
+    protocol = run_protocol(path)
+    estimate = estimate_commands(protocol.commands, protocol.highest_z, path)
+    kinds = collections.Counter(command.kind for command in protocol.commands)
+    counts = channels(protocol)
+    sources = collections.defaultdict(float)
+    for command in protocol.commands:
+        if command.kind == "aspirate":
+            sources[repr(command.where)] += (
+                command.volume * counts[command.instrument])
+    return {
+        "commands": dict(sorted(kinds.items())),
+        "tips": tips_used(protocol),
+        "aspirated": {source: round(volume, 1)
+                      for source, volume in sorted(sources.items())},
+        "seconds": round(estimate.total, 1),
+        "phases": [[phase.name, round(phase.total, 1)]
+                   for phase in estimate.phases if phase.total],
+    }
+
+
+def _worse(current, golden, tolerance):
+    return current > golden * (1 + tolerance) + 1e-6
+
+
+def _phase_seconds(phases):
+    """Seconds per phase name, phases of the same name added up."""
+    seconds = collections.defaultdict(float)
+    for name, total in phases:
+        seconds[name] += total
+    return seconds
+
+
+def compare(current, golden, tolerance=TOLERANCE):
+    """Regressions of ``current`` against ``golden``, as messages."""
+    problems = []
+    if _worse(current["seconds"], golden["seconds"], tolerance):
+        problems.append("runtime {:.0f} s, golden {:.0f} s".format(
+            current["seconds"], golden["seconds"]))
+    golden_phases = _phase_seconds(golden["phases"])
+    for phase, seconds in _phase_seconds(current["phases"]).items():
+        previous = golden_phases.get(phase, 0.0)
+        if _worse(seconds, previous, tolerance):
+            problems.append("phase {!r} {:.1f} s, golden {:.1f} s".format(
+                phase, seconds, previous))
+    if _worse(current["tips"], golden["tips"], tolerance):
+        problems.append("{} tips, golden {}".format(
+            current["tips"], golden["tips"]))
+    for source, volume in current["aspirated"].items():
+        previous = golden["aspirated"].get(source, 0.0)
+        if _worse(volume, previous, tolerance):
+            problems.append("{:.0f} uL drawn from {}, golden {:.0f} uL".format(
+                volume, source, previous))
+    return problems
+
+
+def _golden_path(path, directory):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(directory, name + ".json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the protocols against their golden traces.")
+    parser.add_argument("protocols", nargs="*",
+                        help="protocol scripts (default: all of Protocols/)")
+    parser.add_argument("--golden", default=GOLDEN,
+                        help="directory of the golden traces")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed relative increase (default: %(default)s)")
+    parser.add_argument("--update", action="store_true",
+                        help="store the current traces as the golden ones")
+    args = parser.parse_args(argv)
+    paths = args.protocols or sorted(
+        glob.glob(os.path.join(PROTOCOLS, "*.py")))
+    failed = False
+    for path in paths:
+        name = os.path.basename(path)
+        current = trace(path)
+        golden_path = _golden_path(path, args.golden)
+        if args.update:
+            os.makedirs(args.golden, exist_ok=True)
+            with open(golden_path, "w") as f:
+                json.dump(current, f, indent=2)
+                f.write("\n")
+            print("{}: golden trace updated".format(name))
+            continue
+        if not os.path.exists(golden_path):
+            print("{}: no golden trace, run with --update".format(name))
+            failed = True
+            continue
+        with open(golden_path) as f:
+            golden = json.load(f)
+        problems = compare(current, golden, args.tolerance)
+        if problems:
+            failed = True
+            print("{}: FAILED".format(name))
+            for problem in problems:
+                print("  " + problem)
+        else:
+            print("{}: ok ({:+.1f} s, {:+d} tips)".format(
+                name, current["seconds"] - golden["seconds"],
+                current["tips"] - golden["tips"]))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
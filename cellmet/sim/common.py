@@ -0,0 +1,32 @@
+"""Helpers shared by the tools of :mod:`cellmet.sim`.
+
+Counts over the commands a dry run recorded, and the parsing of the
+``NAME=VALUE`` settings every tool takes on the command line to override
+the settings at the top of a protocol script.
+"""
+
+import ast
+
+
+def channels(protocol):
+    """Number of channels of each pipette of a dry run, by name."""
+    return {instrument.name: instrument.channels
+            for instrument in protocol.loaded_instruments.values()}
+
+
+def tips_used(protocol):
+    """Tips picked up in a dry run, counting every channel."""
+    counts = channels(protocol)
+    return sum(counts[command.instrument] for command in protocol.commands
+               if command.kind == "pick_up_tip")
+
+
+def parse_setting(text):
+    """``(name, value)`` of a ``NAME=VALUE`` argument, the value read as a
+    Python literal when it is one and kept as text otherwise."""
+    name, _, value = text.partition("=")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name, value
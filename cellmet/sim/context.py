@@ -0,0 +1,569 @@
+"""A recording stand-in for the Opentrons ProtocolContext.
+
+The protocol scripts are executed against these classes instead of the
+robot. Labware geometry comes from the Opentrons labware definitions in
+``opentrons_shared_data``, and every liquid handling action is appended to
+``ProtocolContext.commands`` as a :class:`Command` for later analysis.
+"""
+
+import functools
+import os
+import sys
+import types
+
+from opentrons_shared_data.labware import load_definition
+from opentrons_shared_data.module import load_definition as load_module_definition
+from opentrons_shared_data.pipette import name_config
+
+# Front left corner of each OT-2 deck slot, in deck coordinates (mm)
+SLOT_ORIGINS = {
+    1: (0.0, 0.0), 2: (132.5, 0.0), 3: (265.0, 0.0),
+    4: (0.0, 90.5), 5: (132.5, 90.5), 6: (265.0, 90.5),
+    7: (0.0, 181.0), 8: (132.5, 181.0), 9: (265.0, 181.0),
+    10: (0.0, 271.5), 11: (132.5, 271.5), 12: (265.0, 271.5),
+}
+
+FIXED_TRASH = "opentrons_1_trash_1100ml_fixed"
+
+MODULE_MODELS = {
+    "tempdeck": "temperatureModuleV1",
+    "temperature module": "temperatureModuleV1",
+    "temperaturemodulev1": "temperatureModuleV1",
+    "temperature module gen2": "temperatureModuleV2",
+    "temperaturemodulev2": "temperatureModuleV2",
+}
+
+# Room temperature a temperature module starts from (C)
+AMBIENT_TEMPERATURE = 25.0
+
+# Default aspirate and dispense height above the well bottom (mm)
+WELL_BOTTOM_CLEARANCE = 1.0
+
+
+# Scripts only take type names from these modules; a dry run provides them
+# instead of importing the Opentrons package, which takes about a second.
+_STAND_IN_MODULES = ("opentrons", "opentrons.types", "opentrons.protocol_api")
+
+
+class OutOfTipsError(Exception):
+    """Raised when a pipette needs a tip and its tip racks are empty."""
+
+
+class Point:
+    """An x, y, z position in deck coordinates."""
+
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Point(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __eq__(self, other):
+        return (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __repr__(self):
+        return "Point({:.2f}, {:.2f}, {:.2f})".format(self.x, self.y, self.z)
+
+
+class Location:
+    """A point together with the well or labware it belongs to."""
+
+    __slots__ = ("point", "labware")
+
+    def __init__(self, point, labware):
+        self.point = point
+        self.labware = labware
+
+    def move(self, point):
+        return Location(self.point + point, self.labware)
+
+    def __repr__(self):
+        return "Location({!r}, {})".format(self.point, self.labware)
+
+
+class Command:
+    """One recorded robot action.
+
+    ``kind`` is one of move, aspirate, dispense, blow_out, pick_up_tip,
+    drop_tip, delay, pause, comment or temperature. Moves carry the target
+    ``point`` and ``where`` (the well or labware of the target location),
+    and their speed cap in ``rate`` (mm/s, 0 for the default speed); liquid
+    handling carries ``volume`` and the flow ``rate`` in uL/s; delays
+    and temperature changes carry their duration inputs in ``value``.
+    """
+
+    __slots__ = ("kind", "instrument", "point", "where", "volume", "rate",
+                 "value", "text", "direct")
+
+    def __init__(self, kind, instrument=None, point=None, where=None,
+                 volume=0.0, rate=0.0, value=None, text="", direct=False):
+        self.kind = kind
+        self.instrument = instrument
+        self.point = point
+        self.where = where
+        self.volume = volume
+        self.rate = rate
+        self.value = value
+        self.text = text
+        self.direct = direct
+
+    def __repr__(self):
+        return "Command({}, {}, {}, {:g} uL)".format(
+            self.kind, self.where, self.point, self.volume)
+
+
+@functools.lru_cache(maxsize=None)
+def _labware_definition(load_name, version):
+    return load_definition(load_name, version)
+
+
+@functools.lru_cache(maxsize=None)
+def _module_offset(model):
+    return load_module_definition("3", model)["labwareOffset"]
+
+
+@functools.lru_cache(maxsize=None)
+def _pipette_config(name):
+    return name_config()[name]
+
+
+class Well:
+    """A well of a dry-run labware."""
+
+    def __init__(self, parent, name, definition, origin):
+        self.parent = parent
+        self.well_name = name
+        self.depth = definition["depth"]
+        self.max_volume = definition["totalLiquidVolume"]
+        self.shape = definition["shape"]
+        if self.shape == "circular":
+            self.diameter = definition["diameter"]
+            self.length = self.width = None
+        else:
+            self.diameter = None
+            self.length = definition["xDimension"]
+            self.width = definition["yDimension"]
+        self._bottom = Point(origin.x + definition["x"],
+                             origin.y + definition["y"],
+                             origin.z + definition["z"])
+
+    def bottom(self, z=0.0):
+        return Location(self._bottom + Point(0, 0, z), self)
+
+    def top(self, z=0.0):
+        return Location(self._bottom + Point(0, 0, self.depth + z), self)
+
+    def center(self):
+        return Location(self._bottom + Point(0, 0, self.depth / 2), self)
+
+    def __repr__(self):
+        return "{} of {}".format(self.well_name, self.parent)
+
+
+class Labware:
+    """A dry-run labware placed on a deck slot or module."""
+
+    def __init__(self, load_name, origin, label=None, version=1, slot=None):
+        definition = _labware_definition(load_name, version)
+        self.load_name = load_name
+        self.name = label or definition["metadata"]["displayName"]
+        self.parameters = definition["parameters"]
+        self.slot = slot
+        self.highest_z = origin.z + definition["dimensions"]["zDimension"]
+        self._wells = {
+            name: Well(self, name, definition["wells"][name], origin)
+            for column in definition["ordering"] for name in column}
+        self._columns = [list(column) for column in definition["ordering"]]
+
+    @property
+    def is_tiprack(self):
+        return self.parameters.get("isTiprack", False)
+
+    def wells(self):
+        return list(self._wells.values())
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def well(self, name):
+        return self._wells[name]
+
+    def __getitem__(self, name):
+        return self._wells[name]
+
+    def columns(self):
+        return [[self._wells[name] for name in column]
+                for column in self._columns]
+
+    def rows(self):
+        return [list(row) for row in zip(*self.columns())]
+
+    def __repr__(self):
+        return "{} on {}".format(self.name, self.slot)
+
+
+class TemperatureModule:
+    """A dry-run temperature module; ``set_temperature`` records the ramp."""
+
+    def __init__(self, protocol, model, slot):
+        self._protocol = protocol
+        self.model = model
+        self.slot = slot
+        self.labware = None
+        self.temperature = AMBIENT_TEMPERATURE
+        offset = _module_offset(model)
+        x, y = SLOT_ORIGINS[slot]
+        self._origin = Point(x + offset["x"], y + offset["y"], offset["z"])
+
+    def load_labware(self, name, label=None, namespace=None, version=None):
+        self.labware = Labware(name, self._origin, label, version or 1,
+                               self.slot)
+        self._protocol._add_labware(self.labware)
+        return self.labware
+
+    def set_temperature(self, celsius):
+        self._protocol._record(Command(
+            "temperature", value=(self.temperature, celsius),
+            text="Setting temperature to {} C".format(celsius)))
+        self.temperature = celsius
+
+    def deactivate(self):
+        self.temperature = AMBIENT_TEMPERATURE
+
+
+class FlowRates:
+    def __init__(self, aspirate, dispense, blow_out):
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+def _default(config, key):
+    return config[key]["value"]
+
+
+class InstrumentContext:
+    """A dry-run pipette recording its moves and liquid handling."""
+
+    def __init__(self, protocol, name, mount, tip_racks):
+        config = _pipette_config(name)
+        self._protocol = protocol
+        self.name = name
+        self.mount = mount
+        self.channels = config["channels"]
+        self.max_volume = config["maxVolume"]
+        self.min_volume = config["minVolume"]
+        self.flow_rate = FlowRates(_default(config, "defaultAspirateFlowRate"),
+                                   _default(config, "defaultDispenseFlowRate"),
+                                   _default(config, "defaultBlowOutFlowRate"))
+        self.trash_container = protocol.fixed_trash
+        self.current_volume = 0.0
+        self.has_tip = False
+        self._location = None
+        self._tip_racks = []
+        self._next_tips = []
+        self.tip_racks = tip_racks or []
+
+    @property
+    def tip_racks(self):
+        return list(self._tip_racks)
+
+    @tip_racks.setter
+    def tip_racks(self, racks):
+        """Use ``racks``, keeping track of the tips used from racks the
+        pipette already had."""
+        used = [well for rack in self._tip_racks for well in rack.wells()
+                if well not in self._next_tips]
+        self._tip_racks = list(racks)
+        self._next_tips = [well for rack in self._tip_racks
+                           for well in rack.wells() if well not in used]
+
+    def _resolve(self, location, default):
+        if location is None:
+            return self._location
+        if isinstance(location, Well):
+            return default(location)
+        return location
+
+    def _move(self, location, force_direct=False, speed=None):
+        if location is None or location is self._location:
+            return
+        self._location = location
+        self._protocol._record(Command(
+            "move", self.name, location.point, location.labware,
+            rate=speed or 0.0, direct=force_direct))
+
+    def move_to(self, location, force_direct=False, minimum_z_height=None,
+                speed=None):
+        self._move(location, force_direct, speed)
+        return self
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        if volume is None:
+            volume = self.max_volume - self.current_volume
+        if not self.has_tip:
+            raise RuntimeError("{} cannot aspirate without a tip".format(self))
+        if self.current_volume + volume > self.max_volume + 1e-6:
+            raise ValueError("{} cannot hold {:g} uL".format(
+                self, self.current_volume + volume))
+        self._move(self._resolve(
+            location, lambda well: well.bottom(WELL_BOTTOM_CLEARANCE)))
+        self.current_volume += volume
+        self._protocol._record(Command(
+            "aspirate", self.name, self._location.point,
+            self._location.labware, volume, self.flow_rate.aspirate * rate))
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        if volume is None or volume > self.current_volume:
+            volume = self.current_volume
+        self._move(self._resolve(
+            location, lambda well: well.bottom(WELL_BOTTOM_CLEARANCE)))
+        self.current_volume -= volume
+        self._protocol._record(Command(
+            "dispense", self.name, self._location.point,
+            self._location.labware, volume, self.flow_rate.dispense * rate))
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        if volume is None:
+            volume = self.max_volume
+        for _ in range(repetitions):
+            self.aspirate(volume, location, rate)
+            self.dispense(volume, rate=rate)
+        return self
+
+    def blow_out(self, location=None):
+        self._move(self._resolve(location, lambda well: well.top()))
+        self._protocol._record(Command(
+            "blow_out", self.name, self._location.point,
+            self._location.labware, self.current_volume,
+            self.flow_rate.blow_out))
+        self.current_volume = 0.0
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        return self
+
+    def air_gap(self, volume=None, height=None):
+        return self.aspirate(volume)
+
+    def _tips_at(self, well):
+        """The tips the channels pick up with the first one at ``well``."""
+        if self.channels == 1:
+            return [well]
+        for column in well.parent.columns():
+            if well in column:
+                start = column.index(well)
+                return column[start:start + self.channels]
+
+    def _next_tip(self):
+        """The first tip with a full set of tips for the channels from it."""
+        if self.channels == 1:
+            return self._next_tips[0] if self._next_tips else None
+        for rack in self.tip_racks:
+            for column in rack.columns():
+                if (len(column) == self.channels
+                        and all(tip in self._next_tips for tip in column)):
+                    return column[0]
+        return None
+
+    def pick_up_tip(self, location=None):
+        if location is None:
+            location = self._next_tip()
+            if location is None:
+                raise OutOfTipsError(
+                    "{} has no tips left in its tip racks".format(self.name))
+        elif isinstance(location, Location):
+            location = location.labware
+        for tip in self._tips_at(location):
+            if tip in self._next_tips:
+                self._next_tips.remove(tip)
+        self._move(location.top())
+        self._protocol._record(Command(
+            "pick_up_tip", self.name, self._location.point, location))
+        self.has_tip = True
+        return self
+
+    def drop_tip(self, location=None):
+        if location is None:
+            location = self.trash_container.wells()[0].top()
+        self._move(self._resolve(location, lambda well: well.top()))
+        self._protocol._record(Command(
+            "drop_tip", self.name, self._location.point,
+            self._location.labware))
+        self.has_tip = False
+        self.current_volume = 0.0
+        return self
+
+    def return_tip(self):
+        return self.drop_tip()
+
+    def home(self):
+        self._location = None
+        return self
+
+    def reset_tipracks(self):
+        self._next_tips = [well for rack in self._tip_racks
+                           for well in rack.wells()]
+
+    def __repr__(self):
+        return "{} on {} mount".format(self.name, self.mount)
+
+
+class ProtocolContext:
+    """Dry-run protocol context; the recorded actions are in ``commands``."""
+
+    def __init__(self, api_version="2.10"):
+        self.api_version = api_version
+        self.commands = []
+        self.loaded_labwares = {}
+        self.loaded_modules = {}
+        self.loaded_instruments = {}
+        self.rail_lights_on = False
+        self.fixed_trash = self._load(FIXED_TRASH, 12, None, 1)
+        self._clock = None
+
+    def _record(self, command):
+        self.commands.append(command)
+
+    def _add_labware(self, labware):
+        self.loaded_labwares[labware.slot] = labware
+
+    def _load(self, load_name, location, label, version):
+        slot = int(location)
+        if slot in self.loaded_labwares or slot in self.loaded_modules:
+            raise ValueError("Deck slot {} is already occupied".format(slot))
+        x, y = SLOT_ORIGINS[slot]
+        labware = Labware(load_name, Point(x, y, 0.0), label, version, slot)
+        self._add_labware(labware)
+        return labware
+
+    @property
+    def deck(self):
+        """Every deck slot with the labware or module on it, or None."""
+        return {slot: self.loaded_labwares.get(slot)
+                or self.loaded_modules.get(slot) for slot in SLOT_ORIGINS}
+
+    @property
+    def highest_z(self):
+        return max(labware.highest_z for labware in self.loaded_labwares.values())
+
+    def is_simulating(self):
+        return True
+
+    def clock(self):
+        """Estimated seconds of the commands recorded so far, timed with the
+        runtime model of :mod:`cellmet.sim.estimate`; the clock of the
+        incubation timers of the scripts in dry runs."""
+        if self._clock is None:
+            # Imported here: cellmet.sim.estimate imports this module
+            from cellmet.sim.estimate import EstimatedClock
+            self._clock = EstimatedClock(self)
+        return self._clock()
+
+    def load_labware(self, load_name, location, label=None, namespace=None,
+                     version=None):
+        return self._load(load_name, location, label, version or 1)
+
+    def load_module(self, module_name, location=None, configuration=None,
+                    label=None):
+        try:
+            model = MODULE_MODELS[module_name.lower()]
+        except KeyError:
+            raise ValueError("Unsupported module {!r}".format(module_name))
+        slot = int(location)
+        module = TemperatureModule(self, model, slot)
+        self.loaded_modules[slot] = module
+        return module
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None,
+                        replace=False):
+        instrument = InstrumentContext(self, instrument_name, mount, tip_racks)
+        self.loaded_instruments[mount] = instrument
+        return instrument
+
+    def comment(self, msg):
+        self._record(Command("comment", text=msg))
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._record(Command("delay", value=minutes * 60 + seconds,
+                             text=msg or ""))
+
+    def pause(self, msg=None):
+        self._record(Command("pause", text=msg or ""))
+
+    def set_rail_lights(self, on):
+        self.rail_lights_on = on
+
+    def home(self):
+        for instrument in self.loaded_instruments.values():
+            instrument.home()
+
+
+def _install_stand_ins():
+    """Make ``from opentrons import protocol_api, types`` resolve to this
+    module's classes, unless the Opentrons package is already loaded."""
+    if "opentrons" in sys.modules:
+        return
+    api = types.ModuleType("opentrons.protocol_api")
+    api.ProtocolContext = ProtocolContext
+    api.InstrumentContext = InstrumentContext
+    api.Labware = Labware
+    api.Well = Well
+    api.OutOfTipsError = OutOfTipsError
+    location_types = types.ModuleType("opentrons.types")
+    location_types.Point = Point
+    location_types.Location = Location
+    package = types.ModuleType("opentrons")
+    package.__path__ = []
+    package.protocol_api = api
+    package.types = location_types
+    for name, module in zip(_STAND_IN_MODULES,
+                            (package, location_types, api)):
+        sys.modules[name] = module
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled(path, modified):
+    with open(path) as f:
+        return compile(f.read(), path, "exec")
+
+
+def run_protocol(path, api_version="2.10", context=None, **overrides):
+    """Execute the protocol script at ``path`` against a dry-run context.
+
+    Keyword arguments override module level settings of the script (for
+    example ``OVERLAP_OUTPUT_PREP=False``) before ``run`` is called. The
+    script runs against ``context`` when one is given, or a new context for
+    the API level of the script. Returns the context, whose ``commands``
+    hold the recorded actions.
+
+    The Opentrons package is not needed: when it has not been imported, the
+    ``opentrons`` modules the scripts import are stood in for by this
+    module for the rest of the process. Import ``opentrons`` first to run
+    real simulations in the same process.
+    """
+    _install_stand_ins()
+    code = _compiled(os.path.abspath(path), os.path.getmtime(path))
+    namespace = {"__name__": "protocol", "__file__": path}
+    exec(code, namespace)
+    for name, value in overrides.items():
+        if name not in namespace:
+            raise KeyError("{} has no setting {}".format(path, name))
+        namespace[name] = value
+    if context is None:
+        api_version = namespace.get("metadata", {}).get("apiLevel", api_version)
+        context = ProtocolContext(api_version)
+    namespace["run"](context)
+    return context
@@ -0,0 +1,271 @@
+"""Wall-clock runtime estimates for the protocols in Protocols/.
+
+The protocol is dry-run with :mod:`cellmet.sim.context` and the recorded
+commands are timed with a simple OT-2 model: liquid handling at the flow
+rates in force, gantry arcs between labware at the default speeds, fixed
+costs for tip handling and blow-outs, temperature ramps and delays. The
+estimate is split into phases at every ``protocol.comment``.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.estimate Protocols/accutase_splitting.py
+    python -m cellmet.sim.estimate Protocols/*.py --set OVERLAP_OUTPUT_PREP=False
+"""
+
+import argparse
+import json
+import math
+
+from cellmet.sim.common import parse_setting
+from cellmet.sim.context import Point, run_protocol
+
+# Gantry speed for moves (mm/s), the InstrumentContext default
+GANTRY_SPEED = 400.0
+# Z axis speed limit of the pipette mounts (mm/s)
+Z_SPEED = 125.0
+# Acceleration and settling time added to every move segment (s)
+MOVE_OVERHEAD = 0.25
+# Clearance over the wells for arcs inside one labware (mm)
+WELL_Z_MARGIN = 5.0
+# Clearance over the tallest labware for arcs between labware (mm)
+LABWARE_Z_MARGIN = 10.0
+# Gantry position after homing, where the first move starts
+HOME = Point(418.0, 353.0, 218.0)
+
+# Plunger start and stop time added to every aspirate and dispense (s)
+PLUNGER_OVERHEAD = 0.3
+# Moving the plunger to the bottom before aspirating into an empty tip (s)
+PREPARE_ASPIRATE_SECONDS = 1.0
+# Blowing out and returning the plunger (s)
+BLOW_OUT_SECONDS = 1.0
+# Pressing onto a tip and checking it, excluding travel (s)
+PICK_UP_TIP_SECONDS = 4.0
+# Ejecting a tip, excluding travel (s)
+DROP_TIP_SECONDS = 2.5
+
+# Temperature module ramp rates (C/s)
+HEATING_RATE = 0.25
+COOLING_RATE = 0.05
+
+CATEGORIES = ("liquid", "travel", "tips", "waiting")
+
+
+class Phase:
+    """Time spent in one section of a protocol, by category."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+        self.commands = 0
+        self.pauses = 0
+
+    @property
+    def total(self):
+        return sum(self.seconds.values())
+
+
+class Estimate:
+    """Runtime estimate of one protocol run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = [Phase("Setup")]
+
+    @property
+    def total(self):
+        return sum(phase.total for phase in self.phases)
+
+    @property
+    def pauses(self):
+        return sum(phase.pauses for phase in self.phases)
+
+    def as_dict(self):
+        return {
+            "protocol": self.name,
+            "total": round(self.total, 1),
+            "pauses": self.pauses,
+            "phases": [
+                dict(name=phase.name, total=round(phase.total, 1),
+                     **{key: round(value, 1)
+                        for key, value in phase.seconds.items()})
+                for phase in self.phases if phase.total or phase.pauses],
+        }
+
+
+def _top(where):
+    top = getattr(where, "top", None)
+    if top is not None:
+        return top().point.z
+    return where.highest_z
+
+
+def _labware(where):
+    return getattr(where, "parent", where)
+
+
+def move_seconds(start, start_where, end, end_where, highest_z, direct=False,
+                 speed=None):
+    """Time for the gantry to move from ``start`` to ``end``.
+
+    Follows the Opentrons move planning: a straight move inside one well or
+    when forced direct, a low arc over the wells inside one labware, and a
+    full arc over the tallest labware on the deck otherwise. ``speed`` caps
+    the speed of every axis (mm/s).
+    """
+    gantry_speed = min(GANTRY_SPEED, speed) if speed else GANTRY_SPEED
+    z_speed = min(Z_SPEED, speed) if speed else Z_SPEED
+    xy = math.hypot(end.x - start.x, end.y - start.y)
+    if direct or (start_where is not None and start_where is end_where):
+        travel = max(xy / gantry_speed, abs(end.z - start.z) / z_speed)
+        return travel + MOVE_OVERHEAD if travel else 0.0
+    if start_where is not None and _labware(start_where) is _labware(end_where):
+        safe = max(_top(start_where), _top(end_where)) + WELL_Z_MARGIN
+    else:
+        safe = highest_z + LABWARE_Z_MARGIN
+    safe = max(safe, start.z, end.z)
+    segments = [(safe - start.z) / z_speed, xy / gantry_speed,
+                (safe - end.z) / z_speed]
+    return sum(segment + MOVE_OVERHEAD for segment in segments if segment)
+
+
+class CommandTimer:
+    """Times commands one by one, keeping the pipette positions and
+    volumes between them."""
+
+    def __init__(self, highest_z):
+        self.highest_z = highest_z
+        self._positions = {}
+        self._volumes = {}
+
+    def seconds(self, command):
+        """The category and seconds of ``command``; None for comments and
+        pauses, which take no robot time."""
+        kind = command.kind
+        instrument = command.instrument
+        if kind == "move":
+            start, start_where = self._positions.get(instrument, (HOME, None))
+            self._positions[instrument] = (command.point, command.where)
+            return "travel", move_seconds(
+                start, start_where, command.point, command.where,
+                self.highest_z, command.direct, command.rate)
+        if kind == "aspirate":
+            seconds = command.volume / command.rate + PLUNGER_OVERHEAD
+            if not self._volumes.get(instrument):
+                seconds += PREPARE_ASPIRATE_SECONDS
+            self._volumes[instrument] = (
+                self._volumes.get(instrument, 0.0) + command.volume)
+            return "liquid", seconds
+        if kind == "dispense":
+            self._volumes[instrument] = (
+                self._volumes.get(instrument, 0.0) - command.volume)
+            return "liquid", command.volume / command.rate + PLUNGER_OVERHEAD
+        if kind == "blow_out":
+            self._volumes[instrument] = 0.0
+            return "liquid", BLOW_OUT_SECONDS
+        if kind == "pick_up_tip":
+            self._volumes[instrument] = 0.0
+            return "tips", PICK_UP_TIP_SECONDS
+        if kind == "drop_tip":
+            return "tips", DROP_TIP_SECONDS
+        if kind == "delay":
+            return "waiting", command.value
+        if kind == "temperature":
+            start, end = command.value
+            rate = HEATING_RATE if end > start else COOLING_RATE
+            return "waiting", abs(end - start) / rate
+        return None, 0.0
+
+
+def estimate_commands(commands, highest_z, name=""):
+    """Time a recorded command stream; returns an :class:`Estimate`."""
+    estimate = Estimate(name)
+    phase = estimate.phases[0]
+    timer = CommandTimer(highest_z)
+    for command in commands:
+        if command.kind == "comment":
+            phase = Phase(command.text)
+            estimate.phases.append(phase)
+            continue
+        phase.commands += 1
+        if command.kind == "pause":
+            phase.pauses += 1
+        category, seconds = timer.seconds(command)
+        if category is not None:
+            phase.seconds[category] += seconds
+    return estimate
+
+
+class EstimatedClock:
+    """Estimated seconds of the commands a dry-run context has recorded so
+    far; the clock of :class:`cellmet.profiling.Profiler` in dry runs."""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.elapsed = 0.0
+        self._timer = None
+        self._done = 0
+
+    def __call__(self):
+        commands = self.protocol.commands
+        if self._done < len(commands):
+            if self._timer is None:
+                self._timer = CommandTimer(self.protocol.highest_z)
+            for command in commands[self._done:]:
+                self.elapsed += self._timer.seconds(command)[1]
+            self._done = len(commands)
+        return self.elapsed
+
+
+def estimate_protocol(path, **overrides):
+    """Dry-run the protocol at ``path`` and estimate its runtime."""
+    protocol = run_protocol(path, **overrides)
+    return estimate_commands(protocol.commands, protocol.highest_z, path)
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return "{}:{:02d}".format(minutes, seconds)
+
+
+def format_estimate(estimate):
+    """Render an estimate as a per-phase table."""
+    width = max(len(phase.name) for phase in estimate.phases)
+    width = min(max(width, 5), 72)
+    header = "  {:<{w}}  {:>7}" + "  {:>7}" * len(CATEGORIES)
+    lines = [estimate.name,
+             header.format("Phase", "Total", *(c.title() for c in CATEGORIES),
+                           w=width)]
+    for phase in estimate.phases:
+        if not phase.total and not phase.pauses:
+            continue
+        lines.append(header.format(
+            phase.name[:width], format_seconds(phase.total),
+            *(format_seconds(phase.seconds[c]) for c in CATEGORIES), w=width))
+    lines.append("  {:<{w}}  {:>7}".format(
+        "Total", format_seconds(estimate.total), w=width))
+    if estimate.pauses:
+        lines.append("  ({} operator pauses not included)".format(
+            estimate.pauses))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the wall-clock runtime of OT-2 protocols.")
+    parser.add_argument("protocols", nargs="+", help="protocol scripts")
+    parser.add_argument("--set", dest="settings", action="append",
+                        default=[], type=parse_setting, metavar="NAME=VALUE",
+                        help="override a module level setting of the script")
+    parser.add_argument("--json", action="store_true",
+                        help="print the estimates as JSON")
+    args = parser.parse_args(argv)
+    estimates = [estimate_protocol(path, **dict(args.settings))
+                 for path in args.protocols]
+    if args.json:
+        print(json.dumps([e.as_dict() for e in estimates], indent=2))
+    else:
+        print("\n\n".join(format_estimate(e) for e in estimates))
+
+
+if __name__ == "__main__":
+    main()
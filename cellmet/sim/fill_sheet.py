@@ -0,0 +1,45 @@
+"""Fill sheet of the reagent reservoir for a protocol run.
+
+The script is dry-run with its settings and the fill sheet it comments at
+the start of the run is printed: every reservoir well to fill, the reagent
+and the volume, spread over the spare wells when a reagent needs more than
+one. Settings that change the volumes, such as ``PLATE_COUNT`` or
+``CULTURE_PLATE``, can be set for the run.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.fill_sheet Protocols/ipsc_differentiation_with_wash.py --set PLATE_COUNT=6
+"""
+
+import argparse
+
+from cellmet.liquids import FILL_SHEET_TITLE
+from cellmet.sim.common import parse_setting
+from cellmet.sim.context import run_protocol
+
+
+def fill_sheets(path, **overrides):
+    """The fill sheets commented by a dry run of ``path``."""
+    protocol = run_protocol(path, **overrides)
+    return [command.text for command in protocol.commands
+            if command.kind == "comment"
+            and command.text.startswith(FILL_SHEET_TITLE)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Print the reagent fill sheet of OT-2 protocols.")
+    parser.add_argument("protocols", nargs="+", help="protocol scripts")
+    parser.add_argument("--set", dest="settings", action="append",
+                        default=[], type=parse_setting, metavar="NAME=VALUE",
+                        help="override a module level setting of the script")
+    args = parser.parse_args(argv)
+    for path in args.protocols:
+        sheets = fill_sheets(path, **dict(args.settings))
+        print(path)
+        for sheet in sheets or ["No fill sheet"]:
+            print("\n".join("  " + line for line in sheet.splitlines()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Deck layout search for the protocols in Protocols/.
+
+The script is dry-run against a context that places every labware and
+module of the script on another deck slot, and the layout is scored with
+the runtime estimate of :mod:`cellmet.sim.estimate`, so the gantry travel
+of the real command stream decides: waste trips after every well, reagent
+trips for every load, tip pick-ups. Starting from the layout of the
+script, single moves to a free slot and swaps of two slots are tried and
+the best one is kept until none helps. Temperature modules only go on the
+slots they may occupy, and slots can be kept where they are.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.layout Protocols/replating_cardiomyocytes.py
+    python -m cellmet.sim.layout Protocols/ipsc_differentiation_with_wash.py --keep 9
+"""
+
+import argparse
+import itertools
+
+from cellmet.sim.common import parse_setting
+from cellmet.sim.context import FIXED_TRASH, ProtocolContext, run_protocol
+from cellmet.sim.estimate import estimate_commands, format_seconds
+
+# Slots labware can go on; slot 12 holds the fixed trash
+DECK_SLOTS = tuple(range(1, 12))
+# Slots a temperature module can go on, clear of the pipette mounts and
+# the module cable (left and right deck columns)
+MODULE_SLOTS = (1, 3, 4, 6, 7, 9, 10)
+
+
+class LayoutContext(ProtocolContext):
+    """Dry-run context that loads the labware and modules of a script on
+    ``layout[slot]`` instead of ``slot``; unmapped slots stay."""
+
+    def __init__(self, layout, api_version="2.10"):
+        self.layout = dict(layout)
+        super().__init__(api_version)
+
+    def _slot(self, location):
+        slot = int(location)
+        return self.layout.get(slot, slot)
+
+    def _load(self, load_name, location, label, version):
+        if load_name == FIXED_TRASH:
+            return super()._load(load_name, location, label, version)
+        return super()._load(load_name, self._slot(location), label, version)
+
+    def load_module(self, module_name, location=None, configuration=None,
+                    label=None):
+        return super().load_module(module_name, self._slot(location),
+                                   configuration, label)
+
+
+class Layout:
+    """A proposed layout and the runtime estimates it is judged by."""
+
+    def __init__(self, path, names, modules, current, seconds, layout):
+        self.path = path
+        self.names = names
+        self.modules = modules
+        self.current = current
+        self.seconds = seconds
+        self.layout = layout
+
+    @property
+    def saved(self):
+        return self.current - self.seconds
+
+    def moves(self):
+        """The ``(slot, new slot)`` pairs of the labware that move."""
+        return sorted((slot, new) for slot, new in self.layout.items()
+                      if slot != new)
+
+
+def layout_seconds(path, layout, **overrides):
+    """Estimated runtime of ``path`` with its slots moved by ``layout``."""
+    protocol = run_protocol(path, context=LayoutContext(layout), **overrides)
+    return estimate_commands(protocol.commands, protocol.highest_z).total
+
+
+def _deck(path, overrides):
+    """Names of the occupied slots of a dry run and the module slots."""
+    protocol = run_protocol(path, **overrides)
+    names = {slot: labware.name
+             for slot, labware in protocol.loaded_labwares.items()
+             if labware.load_name != FIXED_TRASH}
+    for slot, module in protocol.loaded_modules.items():
+        names.setdefault(slot, "Temperature Module")
+    return names, set(protocol.loaded_modules)
+
+
+def _allowed(slot, new, modules, module_slots, keep):
+    if slot in keep:
+        return new == slot
+    return new in module_slots if slot in modules else True
+
+
+def _changed(layout, changes):
+    changed = dict(layout)
+    changed.update(changes)
+    return changed
+
+
+def _neighbours(layout, modules, module_slots, keep):
+    """Layouts one move to a free slot or one swap away from ``layout``."""
+    taken = set(layout.values())
+    for slot in sorted(layout):
+        for free in DECK_SLOTS:
+            if (free not in taken
+                    and _allowed(slot, free, modules, module_slots, keep)):
+                yield _changed(layout, {slot: free})
+    for first, second in itertools.combinations(sorted(layout), 2):
+        a, b = layout[first], layout[second]
+        if (_allowed(first, b, modules, module_slots, keep)
+                and _allowed(second, a, modules, module_slots, keep)):
+            yield _changed(layout, {first: b, second: a})
+
+
+def optimize_layout(path, keep=(), module_slots=MODULE_SLOTS, **overrides):
+    """Search the deck layout with the shortest estimated runtime for the
+    script at ``path`` with its settings ``overrides``.
+
+    Slots in ``keep`` stay where they are and modules only go on
+    ``module_slots``. Every step takes the best single move or swap, until
+    none shortens the run. Returns a :class:`Layout`.
+    """
+    names, modules = _deck(path, overrides)
+    keep = set(keep)
+    for slot in modules - keep:
+        if slot not in module_slots:
+            keep.add(slot)
+    layout = {slot: slot for slot in names}
+    current = best = layout_seconds(path, layout, **overrides)
+    scores = {}
+    while True:
+        candidates = []
+        for candidate in _neighbours(layout, modules, module_slots, keep):
+            key = tuple(sorted(candidate.items()))
+            if key not in scores:
+                scores[key] = layout_seconds(path, candidate, **overrides)
+            candidates.append((scores[key], key))
+        if not candidates:
+            break
+        seconds, key = min(candidates)
+        if seconds >= best - 1e-6:
+            break
+        best, layout = seconds, dict(key)
+    return Layout(path, names, modules, current, best, layout)
+
+
+def format_layout(result):
+    """Render a layout proposal as a slot table and the time saved."""
+    lines = [result.path]
+    names = {slot: name + (" (temperature module)"
+                           if slot in result.modules else "")
+             for slot, name in result.names.items()}
+    width = max(len(name) for name in names.values())
+    for slot in sorted(names):
+        new = result.layout[slot]
+        lines.append("  {:<{w}}  slot {:>2} -> {:>2}{}".format(
+            names[slot], slot, new, "" if new != slot else "  (stays)",
+            w=width))
+    if not result.moves():
+        lines.append("  The current layout is the best one found")
+    lines.append("  Estimated runtime {} -> {} ({:.0f} s saved)".format(
+        format_seconds(result.current), format_seconds(result.seconds),
+        result.saved))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Propose the OT-2 deck layout with the least travel "
+                    "for a protocol.")
+    parser.add_argument("protocols", nargs="+", help="protocol scripts")
+    parser.add_argument("--keep", action="append", type=int, default=[],
+                        metavar="SLOT",
+                        help="keep the labware of a slot of the script in place")
+    parser.add_argument("--module-slots", type=lambda text: tuple(
+                            int(slot) for slot in text.split(",")),
+                        default=MODULE_SLOTS, metavar="S1,S2,...",
+                        help="slots temperature modules may go on "
+                             "(default: %(default)s)")
+    parser.add_argument("--set", dest="settings", action="append",
+                        default=[], type=parse_setting, metavar="NAME=VALUE",
+                        help="override a module level setting of the script")
+    args = parser.parse_args(argv)
+    results = [optimize_layout(path, args.keep, args.module_slots,
+                               **dict(args.settings))
+               for path in args.protocols]
+    print("\n\n".join(format_layout(result) for result in results))
+
+
+if __name__ == "__main__":
+    main()
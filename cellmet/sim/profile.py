@@ -0,0 +1,45 @@
+"""Per-section profile of a dry run of a protocol.
+
+The script is dry-run with a :class:`cellmet.profiling.Profiler` on the
+dry-run context, timed with the runtime model of
+:mod:`cellmet.sim.estimate`, and the breakdown of estimated seconds and
+calls per section and pipette call is printed.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.profile Protocols/accutase_splitting.py
+    python -m cellmet.sim.profile Protocols/accutase_splitting.py --folded > split.folded
+"""
+
+import argparse
+
+from cellmet.profiling import Profiler
+from cellmet.sim.common import parse_setting
+from cellmet.sim.context import ProtocolContext, run_protocol
+from cellmet.sim.estimate import EstimatedClock
+
+
+def profile_protocol(path, **overrides):
+    """Dry-run the protocol at ``path`` under a profiler and return it."""
+    protocol = ProtocolContext()
+    profiler = Profiler(protocol, clock=EstimatedClock(protocol))
+    run_protocol(path, context=protocol, **overrides)
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Profile a dry run of an OT-2 protocol per section.")
+    parser.add_argument("protocol", help="protocol script")
+    parser.add_argument("--set", dest="settings", action="append",
+                        default=[], type=parse_setting, metavar="NAME=VALUE",
+                        help="override a module level setting of the script")
+    parser.add_argument("--folded", action="store_true",
+                        help="print folded stacks for flame graph tools")
+    args = parser.parse_args(argv)
+    profiler = profile_protocol(args.protocol, **dict(args.settings))
+    print(profiler.folded() if args.folded else profiler.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Parameter sweeps over the settings of a protocol script.
+
+Every combination of the swept settings is dry-run and estimated with
+:mod:`cellmet.sim.estimate` in a process pool. The results table lists the
+estimated runtime, the tips used and the reagent drawn per configuration
+and marks the configurations on the Pareto front of the three, those no
+other configuration beats on all of them.
+
+Run it from the repository root::
+
+    python -m cellmet.sim.sweep Protocols/replating_cardiomyocytes.py \\
+        --vary MIX_CYCLES=3,4,5 --vary PBS_WASH_VOLUME=400,500
+"""
+
+import argparse
+import ast
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cellmet.sim.common import channels, parse_setting, tips_used
+from cellmet.sim.context import run_protocol
+from cellmet.sim.estimate import estimate_commands, format_seconds
+
+OBJECTIVES = ("seconds", "tips", "reagent")
+
+
+class Result:
+    """Estimated cost of one configuration, or the error it raised."""
+
+    def __init__(self, settings, seconds=None, tips=None, reagent=None,
+                 error=None):
+        self.settings = settings
+        self.seconds = seconds
+        self.tips = tips
+        self.reagent = reagent
+        self.error = error
+        self.pareto = False
+
+    def dominates(self, other):
+        mine = [getattr(self, name) for name in OBJECTIVES]
+        theirs = [getattr(other, name) for name in OBJECTIVES]
+        return (all(a <= b for a, b in zip(mine, theirs))
+                and any(a < b for a, b in zip(mine, theirs)))
+
+    def as_dict(self):
+        return {
+            "settings": self.settings,
+            "seconds": None if self.seconds is None else round(self.seconds, 1),
+            "tips": self.tips,
+            "reagent": None if self.reagent is None else round(self.reagent),
+            "pareto": self.pareto,
+            "error": self.error,
+        }
+
+
+def reagent_volume(protocol):
+    """Volume (uL) drawn from stock in a dry run: aspirations from tubes
+    and reservoir wells that nothing has been dispensed into yet, by every
+    channel. Culture plate wells are not stock."""
+    counts = channels(protocol)
+    filled = set()
+    volume = 0.0
+    for command in protocol.commands:
+        if command.kind == "dispense":
+            filled.add(command.where)
+        elif command.kind == "aspirate" and command.where not in filled:
+            load_name = getattr(command.where.parent, "load_name", "")
+            if "wellplate" not in load_name:
+                volume += command.volume * counts[command.instrument]
+    return volume
+
+
+def evaluate(path, settings):
+    """Dry-run ``path`` with ``settings`` and return its :class:`Result`."""
+    try:
+        protocol = run_protocol(path, **settings)
+    except Exception as exc:
+        return Result(settings, error="{}: {}".format(type(exc).__name__, exc))
+    estimate = estimate_commands(protocol.commands, protocol.highest_z, path)
+    return Result(settings, estimate.total, tips_used(protocol),
+                  reagent_volume(protocol))
+
+
+def _evaluate(job):
+    return evaluate(*job)
+
+
+def combinations(grid):
+    """Every combination of the values in ``grid`` (setting name to a list
+    of values), as settings dicts."""
+    names = list(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def mark_pareto_front(results):
+    """Set ``pareto`` on the results no other result dominates."""
+    valid = [result for result in results if result.error is None]
+    for result in valid:
+        result.pareto = not any(other.dominates(result) for other in valid)
+    return results
+
+
+def sweep(path, grid, fixed=None, processes=None):
+    """Estimate ``path`` for every combination of the settings in ``grid``,
+    on top of the ``fixed`` settings, using a pool of ``processes`` workers
+    (all cores by default). Returns the results in grid order."""
+    jobs = [(path, dict(fixed or {}, **settings))
+            for settings in combinations(grid)]
+    workers = processes or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(_evaluate, jobs, chunksize=chunksize))
+    return mark_pareto_front(results)
+
+
+def format_results(results, names):
+    """A table of the results, front first and each part by runtime,
+    followed by the configurations that failed."""
+    header = ["", "runtime", "tips", "reagent uL"] + list(names)
+    rows = []
+    valid = [result for result in results if result.error is None]
+    for result in sorted(valid, key=lambda r: (not r.pareto, r.seconds)):
+        rows.append(["*" if result.pareto else "",
+                     format_seconds(result.seconds), str(result.tips),
+                     "{:.0f}".format(result.reagent)]
+                    + [repr(result.settings.get(name)) for name in names])
+    widths = [max(len(row[i]) for row in [header] + rows)
+              for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+             .rstrip() for row in [header] + rows]
+    lines.append("* Pareto front of runtime, tips and reagent use")
+    for result in results:
+        if result.error is not None:
+            lines.append("! {}: {}".format(", ".join(
+                "{}={!r}".format(name, result.settings.get(name))
+                for name in names), result.error))
+    return "\n".join(lines)
+
+
+def _values(text):
+    name, _, values = text.partition("=")
+    try:
+        values = ast.literal_eval("(" + values + ",)")
+    except (ValueError, SyntaxError):
+        values = tuple(values.split(","))
+    return name, list(values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep the settings of an OT-2 protocol and compare "
+                    "runtime, tips and reagent use.")
+    parser.add_argument("protocol", help="protocol script")
+    parser.add_argument("--vary", dest="grid", action="append", default=[],
+                        type=_values, metavar="NAME=V1,V2,...",
+                        help="values to sweep for a module level setting")
+    parser.add_argument("--set", dest="settings", action="append",
+                        default=[], type=parse_setting, metavar="NAME=VALUE",
+                        help="override a module level setting of the script")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+    grid = dict(args.grid)
+    results = sweep(args.protocol, grid, dict(args.settings), args.processes)
+    if args.json:
+        print(json.dumps([result.as_dict() for result in results], indent=2))
+    else:
+        print(format_results(results, grid))
+
+
+if __name__ == "__main__":
+    main()
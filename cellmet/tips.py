@@ -0,0 +1,191 @@
+"""Contamination-aware tip reuse.
+
+A tip carries traces of every liquid it has touched. ``TipPolicy`` keeps
+track of the places a tip has been in and lets a pipette keep its tip for
+the next step only when every place that step touches may receive traces
+of those places: the same place again, or places declared as sharing
+their liquids (culture wells that are pooled into the same tube anyway).
+A reagent reservoir never shares with cells: a tip that has mixed cells
+does not go back into a reagent.
+
+``TipInventory`` loads as many tip racks as a run needs on the deck slots
+the script leaves free, and pauses the run for fresh racks only when the
+deck cannot hold them all.
+"""
+
+# Travel to the tip rack, pick-up, travel to the trash and drop of one tip
+# change in seconds, used to report the time saved by reusing tips.
+SECONDS_PER_TIP_CHANGE = 12.0
+
+
+class TipPolicy:
+    """Decides when ``pipette`` can keep its tip between steps.
+
+    With ``reuse=False`` every step gets a fresh tip, as without a policy.
+    Tips are counted per channel, so a multi-channel pick-up counts as a
+    column of tips.
+    """
+
+    def __init__(self, pipette, reuse=True):
+        self.pipette = pipette
+        self.reuse = reuse
+        self.tips_used = 0
+        self.tips_saved = 0
+        self._groups = {}
+        self._touched = None
+
+    @property
+    def _channels(self):
+        return getattr(self.pipette, "channels", 1)
+
+    def share(self, *places):
+        """Declare that traces of any of ``places`` may end up in the others."""
+        for place in places:
+            self._groups.setdefault(place, {place}).update(places)
+
+    def _compatible(self, places):
+        return all(self._touched <= self._groups.get(place, {place})
+                   for place in places)
+
+    def pick_up(self, *places):
+        """Get a tip for a step touching ``places``, keeping the current
+        tip if it is safe for all of them."""
+        if self._touched is not None:
+            if self.reuse and self._compatible(places):
+                self.tips_saved += self._channels
+                self._touched |= set(places)
+                return
+            self.drop()
+        self.pipette.pick_up_tip()
+        self.tips_used += self._channels
+        self._touched = set(places)
+
+    def drop(self):
+        """Drop the tip held, if any."""
+        if self._touched is not None:
+            self.pipette.drop_tip()
+            self._touched = None
+
+    @property
+    def seconds_saved(self):
+        return self.tips_saved / self._channels * SECONDS_PER_TIP_CHANGE
+
+    def report(self):
+        return "Tip policy of {}: {} tips used, {} reused (about {:.0f} s saved)".format(
+            self.pipette, self.tips_used, self.tips_saved, self.seconds_saved)
+
+
+# Deck slots labware can go on; slot 12 holds the fixed trash
+DECK_SLOTS = range(1, 12)
+
+
+def _distance(labware, other):
+    a = labware.wells()[0].top().point
+    b = other.wells()[0].top().point
+    return ((a.x - b.x) ** 2 + (a.y - b.y) ** 2) ** 0.5
+
+
+class TipInventory:
+    """The tip racks of a pipette, sized from the tips the run needs.
+
+    The first rack is loaded on the slot of the script. ``stock`` adds
+    racks on the free deck slots, lowest slot number first, until the racks
+    hold the tips needed. With ``near``, the pipette then empties the racks
+    in order of their straight-line distance from that labware, the first
+    rack included; this is a sort by distance from one labware, not a plan
+    of the moves to the wells the tips are used on next. When the deck
+    has no room for enough racks, the run pauses for the operator to
+    refill the racks whenever they are empty. ``spare`` tips are stocked
+    on top of the tips needed for the steps that may take another tip on
+    the robot (a step finished after an incubation it did not fit in).
+    ``check`` fails a dry run that picks up fewer tips than needed or more
+    than needed and spare.
+    """
+
+    def __init__(self, protocol, load_name, slot, label=None):
+        self.protocol = protocol
+        self.load_name = load_name
+        self.label = label
+        self.racks = []
+        self.slots = {}
+        self._load(slot, label)
+        self.pipette = None
+        self.tips_needed = 0
+        self.spare = 0
+        self.refills = 0
+        self.tips_picked = 0
+        self._used = 0
+
+    def _load(self, slot, label):
+        rack = self.protocol.load_labware(load_name=self.load_name,
+                                          location=slot, label=label)
+        self.racks.append(rack)
+        self.slots[rack] = slot
+
+    @property
+    def capacity(self):
+        return sum(len(rack.wells()) for rack in self.racks)
+
+    def _free_slots(self):
+        return [slot for slot in DECK_SLOTS if self.protocol.deck[slot] is None]
+
+    def stock(self, pipette, tips, near=None, spare=0):
+        """Load racks for ``tips`` tips and ``spare`` more (counting every
+        channel) of ``pipette`` and hand them to it, sorted by distance from
+        ``near``."""
+        self.pipette = pipette
+        self.tips_needed = tips
+        self.spare = spare
+        for slot in self._free_slots():
+            if self.capacity >= tips + spare:
+                break
+            self._load(slot, "{} {}".format(self.label, len(self.racks) + 1)
+                       if self.label else None)
+        if near is not None:
+            self.racks.sort(key=lambda rack: _distance(rack, near))
+        pipette.tip_racks = self.racks
+        self._wrap_pick_up_tip(pipette)
+        return self.racks
+
+    def _wrap_pick_up_tip(self, pipette):
+        original = pipette.pick_up_tip
+        channels = getattr(pipette, "channels", 1)
+
+        def pick_up_tip(*args, **kwargs):
+            if self._used + channels > self.capacity:
+                self.protocol.pause("Replace the tip racks in slots {} with "
+                                    "full racks!".format(self._slot_list()))
+                pipette.reset_tipracks()
+                self._used = 0
+                self.refills += 1
+            self._used += channels
+            self.tips_picked += channels
+            return original(*args, **kwargs)
+
+        pipette.pick_up_tip = pick_up_tip
+
+    def check(self):
+        """In a dry run, raise when the tips picked up so far are not the
+        tips needed the racks were stocked for, give or take the spare."""
+        if not self.protocol.is_simulating():
+            return
+        if not self.tips_needed <= self.tips_picked <= self.tips_needed + self.spare:
+            raise ValueError("Tip racks of {}: {} tips needed ({} spare), but "
+                             "the run picked up {}".format(
+                                 self.pipette, self.tips_needed, self.spare,
+                                 self.tips_picked))
+
+    def _slot_list(self):
+        return ", ".join(str(self.slots[rack]) for rack in self.racks)
+
+    def report(self):
+        text = "Tip racks of {}: {} tips needed".format(
+            self.pipette, self.tips_needed)
+        if self.spare:
+            text += " and {} spare".format(self.spare)
+        text += ", racks in slots {}".format(self._slot_list())
+        refills = -(-(self.tips_needed + self.spare) // self.capacity) - 1
+        if refills > 0:
+            text += ", refilled {} {}".format(
+                refills, "time" if refills == 1 else "times")
+        return text
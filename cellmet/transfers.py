@@ -0,0 +1,119 @@
+"""Multi-dispense transfers that cut reservoir round trips.
+
+A P1000 tip holds enough for several 500 uL additions, so instead of one
+reservoir trip per well, ``distribute`` loads the tip once and dispenses
+into as many wells as fit before going back to the source.
+"""
+
+import math
+
+from cellmet.liquids import aspirate
+
+# Largest number of extra splits tried per destination when looking for a
+# packing with fewer trips (1500 uL/well packs best as 3 x 500 uL).
+MAX_EXTRA_SPLITS = 3
+
+
+def _split(volume, parts):
+    return [volume / parts] * parts
+
+
+def plan_distribution(volumes, capacity, disposal_volume=0, min_volume=0):
+    """Plan the trips to deliver ``volumes[i]`` into destination ``i``.
+
+    Volumes larger than a trip can carry are split into equal parts, and the
+    parts are packed in destination order into trips of at most ``capacity``
+    minus ``disposal_volume``. Every split count from the smallest that fits
+    up to ``MAX_EXTRA_SPLITS`` more is tried, keeping parts of at least
+    ``min_volume``; the plan with the fewest trips (then fewest dispenses)
+    wins. Returns a list of trips, each a list of ``(index, volume)`` pairs.
+    """
+    usable = capacity - disposal_volume
+    if usable <= 0:
+        raise ValueError(
+            "Disposal volume {} leaves no room in a {} uL tip".format(
+                disposal_volume, capacity))
+    best = None
+    for extra in range(MAX_EXTRA_SPLITS + 1):
+        parts = []
+        for index, volume in enumerate(volumes):
+            count = max(1, math.ceil(volume / usable))
+            if extra and volume / (count + extra) < min_volume:
+                break
+            parts.extend((index, part) for part in _split(volume, count + extra))
+        else:
+            trips = []
+            load = usable
+            for index, part in parts:
+                if load + part > usable + 1e-6:
+                    trips.append([])
+                    load = 0
+                trips[-1].append((index, part))
+                load += part
+            if best is None or (len(trips), len(parts)) < (
+                    len(best), sum(len(trip) for trip in best)):
+                best = trips
+    return best
+
+
+def tip_capacity(pipette):
+    """Most a tip of ``pipette`` holds: the pipette maximum, or less with
+    smaller tips (a P300 with 200 uL filter tips)."""
+    capacity = pipette.max_volume
+    for rack in pipette.tip_racks[:1]:
+        capacity = min(capacity, rack.wells()[0].max_volume)
+    return capacity
+
+
+def _plan(pipette, volume, destinations, disposal_volume):
+    if not isinstance(volume, (list, tuple)):
+        volume = [volume] * len(destinations)
+    return plan_distribution(volume, tip_capacity(pipette), disposal_volume,
+                             pipette.min_volume)
+
+
+def distribute_trips(pipette, volume, destinations, disposal_volume=0):
+    """Number of source trips ``distribute`` makes for the same arguments."""
+    return len(_plan(pipette, volume, destinations, disposal_volume))
+
+
+def trip_positions(pipette, volume, count, disposal_volume=0):
+    """Positions (0 to ``count`` - 1) of the destinations ``distribute``
+    serves on each source trip for ``count`` destinations, in order; the
+    trips to follow in ``cellmet.ordering.order_wells``."""
+    return [[index for index, _ in trip]
+            for trip in _plan(pipette, volume, [None] * count, disposal_volume)]
+
+
+def distribute(pipette, volume, source, destinations, disposal_volume=0,
+               disposal_location=None, levels=None, before_dispense=None):
+    """Dispense ``volume`` into each destination, loading several per trip.
+
+    ``volume`` is either one volume for every destination or a list with one
+    volume per destination. ``disposal_volume`` is aspirated on top of every
+    load and blown out at ``disposal_location`` (the trash by default) after
+    the last dispense of the trip; without it, the tip is blown out at the
+    last destination as in a single transfer. The pipette must already hold
+    a tip. With a ``cellmet.liquids.LiquidLevels`` ledger as ``levels``, every
+    load is aspirated just below the meniscus of the source well and the
+    dispenses are recorded in the ledger. ``before_dispense`` is called
+    with the index of the destination before every dispense. Returns the
+    number of trips made to the source.
+    """
+    trips = _plan(pipette, volume, destinations, disposal_volume)
+    for trip in trips:
+        load = sum(part for _, part in trip) + disposal_volume
+        aspirate(pipette, load, source, levels)
+        for index, part in trip:
+            if before_dispense is not None:
+                before_dispense(index)
+            pipette.dispense(part, destinations[index])
+            if levels is not None:
+                levels.add(destinations[index], part)
+        if disposal_volume:
+            if disposal_location is None:
+                disposal_location = pipette.trash_container.wells()[0].top()
+            pipette.blow_out(disposal_location)
+        else:
+            pipette.blow_out()
+    return len(trips)
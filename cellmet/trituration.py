@@ -0,0 +1,104 @@
+"""Trituration: mixing a well by pipetting its liquid up and down.
+
+Collecting detached cells starts with several cycles of aspirating near
+the bottom of the well and dispensing back against the opposite wall,
+which is the longest per-well step of the splitting protocols.
+``Trituration`` runs these cycles with a set number of cycles and volume,
+a height profile for the aspirations and dispenses, its own flow rates,
+and straight moves inside the well, and records the time each well took.
+"""
+
+import time
+
+from opentrons import types
+
+# Duration of one straight move between two points of a well (s), used for
+# the time per well when simulating
+SECONDS_PER_MOVE = 0.5
+# Start and stop of the plunger for every aspiration and dispense (s)
+SECONDS_PER_STROKE = 0.3
+
+
+class Trituration:
+    """Mixes wells of a plate with ``pipette``, ``cycles`` times ``volume``.
+
+    Cycle ``n`` aspirates ``aspirate_heights[n]`` mm above the aspiration
+    point of the well (see ``cellmet.wells.PlateLocations``) and dispenses
+    ``dispense_heights[n]`` mm above the well bottom at the opposite wall,
+    or from the top of the well for None; the heights repeat when there are
+    fewer of them than cycles. ``aspirate_rate`` and ``dispense_rate``
+    (uL/s) replace the flow rates of the pipette while mixing; None keeps
+    them. The pipette must hold a tip.
+    """
+
+    def __init__(self, protocol, pipette, volume, cycles,
+                 aspirate_heights=(0.0,), dispense_heights=(None,),
+                 aspirate_rate=None, dispense_rate=None):
+        if not aspirate_heights or not dispense_heights:
+            raise ValueError("Trituration needs at least one aspirate and "
+                             "one dispense height")
+        self.pipette = pipette
+        self.volume = volume
+        self.cycles = cycles
+        self.aspirate_heights = list(aspirate_heights)
+        self.dispense_heights = list(dispense_heights)
+        self.aspirate_rate = aspirate_rate
+        self.dispense_rate = dispense_rate
+        self.seconds = []
+        self._simulating = protocol.is_simulating()
+
+    def _rates(self, liquid=None):
+        flow_rate = liquid or self.pipette.flow_rate
+        aspirate = self.aspirate_rate or flow_rate.aspirate
+        dispense = self.dispense_rate or flow_rate.dispense
+        return aspirate, dispense
+
+    def _points(self, locations, well):
+        bottom = locations.bottom(well)
+        top = locations.top(well)
+        floor = locations.plate[well].bottom().point.z
+        aspirates = [bottom.move(types.Point(0, 0, height))
+                     for height in self.aspirate_heights]
+        dispenses = [top if height is None else top.move(
+                         types.Point(0, 0, floor + height - top.point.z))
+                     for height in self.dispense_heights]
+        return aspirates, dispenses
+
+    def estimate(self, liquid=None):
+        """Estimated seconds to triturate one well, at the flow rates of the
+        ``cellmet.liquid_classes.LiquidClass`` ``liquid`` when the
+        trituration has none of its own (default: the current rates of the
+        pipette)."""
+        aspirate, dispense = self._rates(liquid)
+        return self.cycles * (self.volume / aspirate + self.volume / dispense
+                              + 2 * (SECONDS_PER_MOVE + SECONDS_PER_STROKE))
+
+    def __call__(self, locations, well):
+        """Triturate ``well`` of the plate of ``locations``."""
+        start = time.monotonic()
+        aspirate, dispense = self._rates()
+        aspirates, dispenses = self._points(locations, well)
+        pipette = self.pipette
+        for cycle in range(self.cycles):
+            pipette.move_to(aspirates[cycle % len(aspirates)],
+                            force_direct=cycle > 0)
+            pipette.aspirate(self.volume,
+                             rate=aspirate / pipette.flow_rate.aspirate)
+            pipette.move_to(dispenses[cycle % len(dispenses)],
+                            force_direct=True)
+            pipette.dispense(self.volume,
+                             rate=dispense / pipette.flow_rate.dispense)
+        if self._simulating:
+            self.seconds.append((well, self.estimate()))
+        else:
+            self.seconds.append((well, time.monotonic() - start))
+
+    def report(self):
+        if not self.seconds:
+            return "Trituration with {}: no wells".format(self.pipette)
+        well, longest = max(self.seconds, key=lambda entry: entry[1])
+        mean = sum(seconds for _, seconds in self.seconds) / len(self.seconds)
+        return ("Trituration with {}: {} cycles of {:.0f} uL in {} wells, "
+                "{:.1f} s per well (longest {:.1f} s in {})".format(
+                    self.pipette, self.cycles, self.volume, len(self.seconds),
+                    mean, longest, well))
@@ -0,0 +1,165 @@
+"""Culture plate well locations and the well operations built on them.
+
+Every protocol aspirates from a point near the bottom wall of a well and
+dispenses from a point above the opposite wall. ``PlateLocations`` works
+these points out once per plate from the well geometry of its labware
+definition, so any plate format can be used, and the functions below run
+the usual operations over a list of wells with them.
+
+The protocol volumes are written for the wells of a 6-well plate;
+``volume_scale`` converts them to the wells of another format by growth
+area.
+"""
+
+import math
+
+from opentrons import types
+
+from cellmet.transfers import distribute
+
+# Aspiration point height above the nominal well bottom (mm) on the plate
+# formats the protocols were tuned on; slightly below it on the 6-well
+# plates, so the tip drains the well
+BOTTOM_HEIGHTS = {"corning_6_wellplate_16.8ml_flat": -0.5}
+# Aspiration point height above the nominal well bottom on other formats (mm)
+BOTTOM_HEIGHT = 0.0
+# Dispense point height above the well top (mm)
+TOP_HEIGHT = 1.7
+# Distance of the aspirate and dispense points from the well wall (mm)
+WALL_CLEARANCE = 2.5
+# Distance between the channels of a multi-channel pipette (mm)
+CHANNEL_PITCH = 9.0
+# Growth area of a corning_6_wellplate_16.8ml_flat well, which the protocol
+# volumes are written for (mm2)
+REFERENCE_WELL_AREA = math.pi * (35.43 / 2) ** 2
+
+
+def plate_wells(plate):
+    """Names of the wells of ``plate`` row by row: A1, A2, ..., B1, ..."""
+    return [well.well_name for row in plate.rows() for well in row]
+
+
+def well_area(well):
+    """Bottom area of ``well`` (mm2)."""
+    if well.diameter is not None:
+        return math.pi * (well.diameter / 2) ** 2
+    return well.length * well.width
+
+
+def volume_scale(plate):
+    """Factor from 6-well plate volumes to the wells of ``plate``."""
+    return well_area(plate.wells()[0]) / REFERENCE_WELL_AREA
+
+
+def column_wells(plate, wells, channels):
+    """Split ``wells`` between a ``channels``-channel pipette and a
+    single-channel one.
+
+    A multi-channel pipette reaches a whole plate column from its top well
+    when the column has one well per channel, at the channel pitch, and
+    all of them are in ``wells``. Returns the top wells of those columns,
+    and the remaining wells in their order in ``wells``.
+    """
+    wanted = set(wells)
+    tops = []
+    covered = set()
+    for column in plate.columns():
+        names = [well.well_name for well in column]
+        ys = [well.center().point.y for well in column]
+        if (len(column) == channels and wanted.issuperset(names)
+                and all(abs(a - b - CHANNEL_PITCH) < 0.1
+                        for a, b in zip(ys, ys[1:]))):
+            tops.append(names[0])
+            covered.update(names)
+    return tops, [well for well in wells if well not in covered]
+
+
+class PlateLocations:
+    """Aspirate (bottom) and dispense (top) locations of plate wells.
+
+    The bottom location sits at the front wall of the well near the
+    bottom, the top location at the back wall above the liquid.
+    """
+
+    def __init__(self, plate, wells):
+        self.plate = plate
+        self._bottom = {}
+        self._top = {}
+        bottom_height = BOTTOM_HEIGHTS.get(plate.load_name, BOTTOM_HEIGHT)
+        for name in wells:
+            well = plate[name]
+            if well.diameter is not None:
+                radius = well.diameter / 2
+            else:
+                radius = min(well.length, well.width) / 2
+            offset = max(0.0, radius - WALL_CLEARANCE)
+            self._bottom[name] = well.bottom(bottom_height).move(
+                types.Point(0, -offset, 0))
+            self._top[name] = well.top(TOP_HEIGHT).move(
+                types.Point(0, offset, 0))
+
+    def bottom(self, well):
+        return self._bottom[well]
+
+    def top(self, well):
+        return self._top[well]
+
+    def bottoms(self, wells):
+        return [self._bottom[well] for well in wells]
+
+    def tops(self, wells):
+        return [self._top[well] for well in wells]
+
+
+def remove_to_waste(pipette, locations, wells, volume, waste, repeats=1):
+    """Aspirate ``volume`` from the bottom of each well ``repeats`` times,
+    emptying every load into ``waste``. The pipette must hold a tip."""
+    waste_top = waste.top()
+    for well in wells:
+        bottom = locations.bottom(well)
+        for _ in range(repeats):
+            pipette.move_to(bottom)
+            pipette.aspirate(volume)
+            pipette.dispense(volume, waste_top)
+            pipette.blow_out()
+
+
+def add_from_reservoir(pipette, volume, source, locations, wells,
+                       disposal_volume=0, levels=None, before_dispense=None):
+    """Dispense ``volume`` from ``source`` into the top of each well,
+    several wells per load (see ``cellmet.transfers.distribute``).
+    ``before_dispense`` is called with the well before every dispense."""
+    on_dispense = None
+    if before_dispense is not None:
+        def on_dispense(index):
+            before_dispense(wells[index])
+    return distribute(pipette, volume, source, locations.tops(wells),
+                      disposal_volume=disposal_volume, levels=levels,
+                      before_dispense=on_dispense)
+
+
+def exchange(waste_pipette, removal_volume, waste, pipette, volume, source,
+             locations, wells, repeats=1, disposal_volume=0, levels=None,
+             before_dispense=None):
+    """Replace the liquid of each well, well by well: ``waste_pipette``
+    removes it as in ``remove_to_waste`` right before ``pipette`` dispenses
+    ``volume`` from ``source`` into the well, several wells per load as in
+    ``add_from_reservoir``. A well stands dry only between its own removal
+    and refill, and each pipette keeps its own tip. Both pipettes must hold
+    a tip. ``before_dispense`` is called with the well between its removal
+    and every dispense into it."""
+    removed = set()
+
+    def remove(index):
+        well = wells[index]
+        if well not in removed:
+            remove_to_waste(waste_pipette, locations, [well], removal_volume,
+                            waste, repeats)
+            removed.add(well)
+        if before_dispense is not None:
+            before_dispense(well)
+
+    return distribute(pipette, volume, source, locations.tops(wells),
+                      disposal_volume=disposal_volume, levels=levels,
+                      before_dispense=remove)
+
@@ -0,0 +1,85 @@
+"""Meniscus heights of the level ledger and the reservoir fill plan."""
+
+import math
+
+import pytest
+
+from cellmet.liquids import (CONICAL_BOTTOM_HEIGHT, MAX_FILL_FRACTION,
+                             MIN_CLEARANCE, V_BOTTOM_HEIGHT, LiquidLevels,
+                             assign_sources)
+from cellmet.sim.context import ProtocolContext
+
+
+@pytest.fixture
+def protocol():
+    return ProtocolContext()
+
+
+@pytest.fixture
+def trough(protocol):
+    return protocol.load_labware("usascientific_12_reservoir_22ml", 7)["A1"]
+
+
+def test_flat_well_height_is_volume_over_area(protocol):
+    well = protocol.load_labware("corning_6_wellplate_16.8ml_flat", 5)["A1"]
+    area = math.pi * (well.diameter / 2) ** 2
+    assert LiquidLevels().height(well, 2000) == pytest.approx(2000 / area)
+
+
+def test_conical_tube_fills_the_cone_first(protocol):
+    tube = protocol.load_labware("opentrons_15_tuberack_falcon_15ml_conical", 8)["A1"]
+    levels = LiquidLevels()
+    area = math.pi * (tube.diameter / 2) ** 2
+    cone = area * CONICAL_BOTTOM_HEIGHT / 3
+    assert levels.height(tube, cone) == pytest.approx(CONICAL_BOTTOM_HEIGHT)
+    assert levels.height(tube, cone / 8) == pytest.approx(CONICAL_BOTTOM_HEIGHT / 2)
+    assert levels.height(tube, cone + area) == pytest.approx(CONICAL_BOTTOM_HEIGHT + 1)
+
+
+def test_trough_fills_the_v_bottom_first(trough):
+    levels = LiquidLevels()
+    area = trough.length * trough.width
+    vee = area * V_BOTTOM_HEIGHT / 2
+    assert levels.height(trough, vee) == pytest.approx(V_BOTTOM_HEIGHT)
+    assert levels.height(trough, vee / 4) == pytest.approx(V_BOTTOM_HEIGHT / 2)
+    assert levels.height(trough, vee + area) == pytest.approx(V_BOTTOM_HEIGHT + 1)
+
+
+def test_full_trough_reaches_its_depth(trough):
+    assert LiquidLevels().height(trough, trough.max_volume) == pytest.approx(
+        trough.depth, abs=0.1)
+
+
+def test_aspirates_below_the_meniscus_left_behind(trough):
+    levels = LiquidLevels()
+    levels.fill(trough, 10000)
+    location = levels.location(trough, 1000)
+    expected = levels.height(trough, 9000) - levels.immersion
+    assert location.point.z == pytest.approx(trough.bottom(expected).point.z)
+
+
+def test_aspiration_height_stays_off_the_bottom(trough):
+    levels = LiquidLevels()
+    levels.fill(trough, 500)
+    location = levels.location(trough, 500)
+    assert location.point.z == pytest.approx(trough.bottom(MIN_CLEARANCE).point.z)
+
+
+def test_cannot_take_more_than_the_well_holds(trough):
+    levels = LiquidLevels()
+    levels.fill(trough, 500)
+    with pytest.raises(ValueError):
+        levels.remove(trough, 600)
+
+
+def test_fills_stop_short_of_the_brim(protocol):
+    reservoir = protocol.load_labware("usascientific_12_reservoir_22ml", 7)
+    wells = reservoir.wells()[:2]
+    limit = wells[0].max_volume * MAX_FILL_FRACTION
+    sources, fills = assign_sources(wells, [limit / 2 / 1.1] * 2)
+    assert sources == [wells[0], wells[0]]
+    assert fills[wells[0]] == pytest.approx(limit)
+    sources, fills = assign_sources(wells, [limit / 2] * 2)
+    assert sources == wells
+    with pytest.raises(ValueError):
+        assign_sources(wells, [limit] * 3)
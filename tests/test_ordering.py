@@ -0,0 +1,59 @@
+"""Visit orders of the wells of a plate."""
+
+import pytest
+
+from cellmet import ordering
+from cellmet.ordering import EXACT_SEARCH_LIMIT, order_wells
+from cellmet.sim.context import ProtocolContext
+
+
+@pytest.fixture
+def protocol():
+    return ProtocolContext()
+
+
+def _names(plate, count):
+    return [well.well_name for well in plate.wells()[:count]]
+
+
+def _fail(route):
+    raise AssertionError("exact search run for {} wells".format(len(route.points)))
+
+
+def test_exact_search_up_to_the_limit(protocol, monkeypatch):
+    plate = protocol.load_labware("corning_12_wellplate_6.9ml_flat", 5)
+    waste = protocol.load_labware("agilent_1_reservoir_290ml", 11)
+    wells = _names(plate, EXACT_SEARCH_LIMIT)
+    searched = []
+    exact = ordering._exact
+    monkeypatch.setattr(ordering, "_exact",
+                        lambda route: searched.append(route) or exact(route))
+    order = order_wells(plate, wells, start=waste, anchor=waste, end=waste)
+    assert searched
+    assert sorted(order) == sorted(wells)
+
+
+def test_heuristics_above_the_limit(protocol, monkeypatch):
+    plate = protocol.load_labware("corning_12_wellplate_6.9ml_flat", 5)
+    waste = protocol.load_labware("agilent_1_reservoir_290ml", 11)
+    wells = _names(plate, EXACT_SEARCH_LIMIT + 1)
+    monkeypatch.setattr(ordering, "_exact", _fail)
+    order = order_wells(plate, wells, start=waste, anchor=waste, end=waste)
+    assert sorted(order) == sorted(wells)
+
+
+def test_exact_order_is_never_longer_than_the_heuristics(protocol):
+    plate = protocol.load_labware("corning_6_wellplate_16.8ml_flat", 5)
+    reservoir = protocol.load_labware("usascientific_12_reservoir_22ml", 7)
+    route = ordering._Route([ordering._xy(well) for well in plate.wells()],
+                            ordering._xy(reservoir), None, ordering._xy(reservoir),
+                            [[0, 1], [2, 3], [4, 5]])
+    lengths = {method: route.length(search(route))
+               for method, search in ordering.METHODS.items()}
+    assert lengths["exact"] <= min(lengths["serpentine"], lengths["nearest"]) + 1e-6
+
+
+def test_unknown_method_is_rejected(protocol):
+    plate = protocol.load_labware("corning_6_wellplate_16.8ml_flat", 5)
+    with pytest.raises(ValueError):
+        order_wells(plate, _names(plate, 6), method="random")
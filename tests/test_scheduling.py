@@ -0,0 +1,67 @@
+"""Admission and deferral of the steps run inside an incubation window."""
+
+import pytest
+
+from cellmet.scheduling import SAFETY_MARGIN, IncubationTimer, Step
+from cellmet.sim.context import ProtocolContext
+
+
+@pytest.fixture
+def protocol():
+    return ProtocolContext()
+
+
+def _step(protocol, name, parts, log):
+    """A step of parts that take exactly their estimate on the dry-run clock."""
+    def part(number, seconds):
+        def action():
+            protocol.delay(seconds=seconds)
+            log.append((name, number))
+        return action, seconds
+    return Step(name, [part(number, seconds) for number, seconds in enumerate(parts)],
+                begin=lambda: log.append((name, "begin")),
+                end=lambda: log.append((name, "end")), overhead=0)
+
+
+def test_admit_keeps_the_safety_margin(protocol):
+    timer = IncubationTimer(protocol, minutes=1)
+    assert not timer.admit(60 / (1 + SAFETY_MARGIN) + 1)
+    assert timer.admit(60 / (1 + SAFETY_MARGIN) - 1)
+
+
+def test_admit_reserves_the_overhead(protocol):
+    timer = IncubationTimer(protocol, minutes=1)
+    assert not timer.admit(30, reserve=30)
+    assert timer.admit(30, reserve=10)
+
+
+def test_steps_that_fit_run_in_order(protocol):
+    log = []
+    timer = IncubationTimer(protocol, minutes=1)
+    steps = [_step(protocol, "a", [10, 10], log), _step(protocol, "b", [10], log)]
+    assert timer.run_within(steps) == []
+    assert log == [("a", "begin"), ("a", 0), ("a", 1), ("a", "end"),
+                   ("b", "begin"), ("b", 0), ("b", "end")]
+
+
+def test_step_stops_between_parts_at_the_mark(protocol):
+    log = []
+    timer = IncubationTimer(protocol, minutes=1)
+    steps = [_step(protocol, "a", [10, 10, 10], log),
+             _step(protocol, "b", [10, 10, 10], log)]
+    left = timer.run_within(steps)
+    # 50 s run: the last part would need 12.5 s with the margin, 10 s are left
+    assert timer.elapsed() == pytest.approx(50)
+    assert left == [steps[1]] and len(steps[1].parts) == 1
+    assert log[-2:] == [("b", 1), ("b", "end")]
+    assert left[0]() is True
+    assert log[-3:] == [("b", "begin"), ("b", 2), ("b", "end")]
+
+
+def test_step_whose_first_part_does_not_fit_is_not_started(protocol):
+    log = []
+    timer = IncubationTimer(protocol, minutes=1)
+    steps = [_step(protocol, "a", [50], log)]
+    assert timer.run_within(steps) == steps
+    assert log == []
+    assert not any(command.kind == "comment" for command in protocol.commands)
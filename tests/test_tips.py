@@ -0,0 +1,50 @@
+"""Tip racks stocked for a run and the dry-run tip check."""
+
+import pytest
+
+from cellmet.sim.context import ProtocolContext
+from cellmet.tips import TipInventory
+
+TIPRACK = "opentrons_96_filtertiprack_1000ul"
+
+
+@pytest.fixture
+def protocol():
+    return ProtocolContext()
+
+
+def _stocked(protocol, tips, spare=0):
+    inventory = TipInventory(protocol, load_name=TIPRACK, slot=4)
+    pipette = protocol.load_instrument("p1000_single", "right",
+                                       tip_racks=inventory.racks)
+    inventory.stock(pipette, tips, spare=spare)
+    return inventory, pipette
+
+
+def _use(pipette, tips):
+    for _ in range(tips):
+        pipette.pick_up_tip()
+        pipette.drop_tip()
+
+
+@pytest.mark.parametrize("picked", [3, 4])
+def test_check_accepts_the_tips_needed_and_the_spare(protocol, picked):
+    inventory, pipette = _stocked(protocol, 3, spare=1)
+    _use(pipette, picked)
+    inventory.check()
+
+
+@pytest.mark.parametrize("picked", [2, 5])
+def test_check_rejects_other_counts(protocol, picked):
+    inventory, pipette = _stocked(protocol, 3, spare=1)
+    _use(pipette, picked)
+    with pytest.raises(ValueError):
+        inventory.check()
+
+
+def test_racks_added_for_the_tips_needed(protocol):
+    inventory, pipette = _stocked(protocol, 150, spare=50)
+    assert len(inventory.racks) == 3
+    _use(pipette, 200)
+    inventory.check()
+    assert inventory.refills == 0
@@ -0,0 +1,35 @@
+"""Trip packing of the multi-dispense transfers."""
+
+import pytest
+
+from cellmet.transfers import plan_distribution
+
+
+def test_packs_wells_into_full_trips():
+    trips = plan_distribution([500] * 6, capacity=1000)
+    assert trips == [[(0, 500), (1, 500)], [(2, 500), (3, 500)],
+                     [(4, 500), (5, 500)]]
+
+
+def test_splits_large_volumes_into_equal_parts():
+    trips = plan_distribution([1500] * 2, capacity=1000)
+    assert len(trips) == 3
+    assert all(sum(part for _, part in trip) == 1000 for trip in trips)
+    assert [index for trip in trips for index, _ in trip] == [0, 0, 0, 1, 1, 1]
+
+
+def test_disposal_volume_takes_room_from_every_trip():
+    trips = plan_distribution([500] * 6, capacity=1000, disposal_volume=50)
+    # 2 x 500 uL no longer fit a trip; halves pack 3 to a trip instead of 1
+    assert len(trips) == 4
+    assert all(sum(part for _, part in trip) <= 950 for trip in trips)
+
+
+def test_min_volume_limits_the_extra_splits():
+    trips = plan_distribution([1500], capacity=1000, min_volume=600)
+    assert [part for trip in trips for _, part in trip] == [750, 750]
+
+
+def test_disposal_volume_filling_the_tip_is_rejected():
+    with pytest.raises(ValueError):
+        plan_distribution([500], capacity=1000, disposal_volume=1000)